@@ -1,10 +1,51 @@
 from random import randrange
 import time
 import random
-
-N = 8
-
-AI_path = []  # record the best path found by AI
+import os
+import math
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from bitboard import (N, Position, op, fromBoard, pathToMove, moveToPath, unpackMove,
+                      makeMove, unmakeMove, gameOver, getAllMoves, getJumpPaths, getMovePaths, getPromotionPaths,
+                      STEP_TABLE, DRAW_PLIES, BLACK_KING_ROW, WHITE_KING_ROW, MOVE_OK, OFF_BOARD, validateMove, legalMoveSet)
+from evaluate import evaluate, encode, evaluateBatch
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from tablebase import Tablebase
+from book import Book
+from stats import SearchStats
+
+# shared by all the engines of the process
+MAX_PLY = 64
+BOOK = None  # opening book, see loadBook
+TB = None  # endgame tablebase, see loadTablebase
+TB_WIN = 90000  # score of a tablebase win, minus its distance in plies
+
+# score the children of the last ply together, see Engine.frontier. Off by default: a NumPy
+# call costs about as much as 15 evaluate calls and a node has far fewer children, so it
+# only pays off with a wider tree or a heavier evaluation
+BATCH_EVAL = False
+
+# search with Engine.pvSearch (negamax, null windows and aspiration windows) instead of
+# the plain alpha-beta of Engine.minimax
+PVS = False
+ASPIRATION = 50  # half width of the first aspiration window, half a man
+
+# parallel search: the root moves are searched by a pool of worker processes, shared by
+# all the engines. Each parallel search takes one slot of POOL_ALPHAS for its best score.
+POOL = None  # the ProcessPoolExecutor, started once by startPool
+POOL_WORKERS = 0  # its number of worker processes
+POOL_SLOTS = 32  # parallel searches at the same time, the others wait for a slot
+POOL_ALPHAS = None  # best root score so far of each slot, shared with the workers
+FREE_SLOTS = None  # queue of the unused slots
+POOL_LOCK = threading.Lock()
+WORKER_ENGINE = None  # the Engine of a worker process
+WORKER_TT_MB = 16  # transposition table of each worker
+
+
+class SearchTimeout(Exception):
+    pass
 
 
 # set up the board
@@ -30,264 +71,744 @@ def initBoard():
     return board
 
 
+# check the move list of color against the rules, return MOVE_OK or the reason code
+# (bitboard.MOVE_REASONS) of the rejection
+def checkMove(board, move_list, color):
+    for (y, x) in move_list:
+        if not (0 <= y < N and 0 <= x < N) or (y + x) % 2 != 1:
+            return OFF_BOARD
+    return validateMove(fromBoard(board, color), pathToMove(move_list), color)
+
+
 # check whether the move list is valid
 def canMove(board, move_list, color):
-    paths = getAllMoves(board, color)
-    for path in paths:
-        if len(path) == len(move_list):  # the move is in the valid move list ?
-            same = True
-            for i in range(len(move_list)):
-                if path[i] != move_list[i]:
-                    same = False
-                    break
-            if same:
+    return checkMove(board, move_list, color) == MOVE_OK
+
+
+def loadBook(path='opening.book'):
+    global BOOK
+    BOOK = Book(path)
+
+
+def loadTablebase(path='endgame.tb'):
+    global TB
+    TB = Tablebase(path)
+
+
+# search score of a tablebase value, for the side to move
+def tbScore(value):
+    if value > 0:
+        return TB_WIN - value
+    if value < 0:
+        return -value - 1 - TB_WIN  # a loss in -value - 1 plies
+    return 0
+
+
+# One search: its transposition table, move ordering tables, statistics and result.
+# Engines share nothing but the book, the tablebase and the worker pool, so several of
+# them can search at the same time (threads, games, pondering).
+class Engine:
+    def __init__(self, table=None, pvs=None):
+        self.tt = table if table is not None else TranspositionTable()
+        self.pvs = PVS if pvs is None else pvs
+        self.book = BOOK
+        self.tb = TB
+        self.path = None  # best move found (packed, see bitboard.py)
+        self.depth = 0  # depth of the last completed search
+        self.pv = {}  # hash -> move of the principal variation of the previous iteration
+        self.deadline = None  # time.time() at which the search has to stop
+        self.nodes = 0
+        self.leaves = 0  # positions scored by the evaluation
+        self.stats = None  # SearchStats of the last search
+        self.poolCounts = [0, 0, 0, 0]  # cutoffs, first move cutoffs, TT probes and hits of the workers
+        self.alphaSlot = None  # slot of POOL_ALPHAS to share the root score, in a worker
+        # draws: the positions before the current one since the last capture or man move
+        # (of the game, then of the search path) and their number of plies
+        self.hashes = []
+        self.quiet = 0
+        self.drawPlies = DRAW_PLIES
+        # move ordering, reset by search and kept across the iterations
+        self.killers = [[None, None] for i in range(MAX_PLY)]  # two quiet moves per ply that caused a cutoff
+        self.history = [0] * 1024  # score of the quiet moves (from | to << 5) that caused a cutoff
+        self.cutoffs = [0] * MAX_PLY  # beta cutoffs per ply
+        self.firstCutoffs = [0] * MAX_PLY  # cutoffs per ply on the first move tried
+
+    def reset(self):
+        self.path = None
+        self.depth = 0
+        self.pv = {}
+        self.nodes = 0
+        self.leaves = 0
+        self.poolCounts = [0, 0, 0, 0]
+        self.hashes = []
+        self.quiet = 0
+        self.drawPlies = DRAW_PLIES
+        for ply in range(MAX_PLY):
+            self.killers[ply][0] = self.killers[ply][1] = None
+            self.cutoffs[ply] = self.firstCutoffs[ply] = 0
+        self.history[:] = [0] * 1024
+
+    # sort the moves: the table move first, then the longest captures and the promotions,
+    # then the killer moves of this ply and at last the history score
+    def orderMoves(self, pos, paths, depth, color, first):
+        if len(paths) < 2:
+            return
+        kingRow = BLACK_KING_ROW if color == 'b' else WHITE_KING_ROW
+        men = ~pos.kings
+        if paths[0] >> 10:  # jumps, there are only jumps
+            def key(path):
+                if path == first:
+                    return 1 << 30
+                promoted = men >> (path & 31) & kingRow >> (path >> 5 & 31) & 1
+                return ((path >> 10).bit_count() << 1) + promoted
+        else:
+            killer1, killer2 = self.killers[depth]
+            history = self.history
+
+            def key(path):
+                if path == first:
+                    return 1 << 30
+                if men >> (path & 31) & kingRow >> (path >> 5) & 1:
+                    return 1 << 29
+                if path == killer1:
+                    return 1 << 28
+                if path == killer2:
+                    return 1 << 27
+                return history[path]
+        paths.sort(key=key, reverse=True)
+
+    # the moves in the order of orderMoves, one at a time and generated in stages, so that
+    # a cutoff on an early move skips the work for the others: the captures if there are
+    # any (they are forced), else the table move, the promotions, the killers of this ply
+    # and at last the other quiet moves by history
+    def pickMoves(self, pos, depth, color, first):
+        paths = getJumpPaths(pos, color)
+        if paths:
+            self.orderMoves(pos, paths, depth, color, first)
+            yield from paths
+            return
+
+        own = pos.black if color == 'b' else pos.white
+        empty = ~(pos.black | pos.white)
+        kings = pos.kings
+
+        def legal(path):  # a step of a piece of color to an empty square
+            s, t = path & 31, path >> 5
+            return own >> s & empty >> t & 1 and t in STEP_TABLE['k' if kings >> s & 1 else color][s]
+
+        done = []
+        if first is not None and not first >> 10 and legal(first):
+            done.append(first)
+            yield first
+        for path in getPromotionPaths(pos, color):
+            if path != first:
+                done.append(path)
+                yield path
+        for killer in self.killers[depth]:
+            if killer is not None and killer not in done and legal(killer):
+                done.append(killer)
+                yield killer
+
+        paths = [path for path in getMovePaths(pos, color) if path not in done]
+        history = self.history
+        paths.sort(key=history.__getitem__, reverse=True)
+        yield from paths
+
+    # a draw: the position came before since the last capture or man move (it takes at
+    # least 4 plies to come back, with the same side to move), or the draw rule
+    def drawn(self, pos):
+        if self.quiet >= self.drawPlies:
+            return True
+        hashes = self.hashes
+        key = pos.hash
+        for i in range(len(hashes) - 4, len(hashes) - self.quiet - 1, -2):
+            if hashes[i] == key:
                 return True
-    return False
-
-
-# make the move on the board
-def makeMove(board, move_list):
-    regicide = False
-    for i in range(1, len(move_list)):
-        (y1, x1) = move_list[i - 1]
-        (y2, x2) = move_list[i]
-
-        board[y1][x1], board[y2][x2] = ' ', board[y1][x1]
-        if abs(y2 - y1) == 2:  # is jump ?
-            my, mx = (y1 + y2) >> 1, (x1 + x2) >> 1
-            if board[my][mx] in ['B', 'W']:  # eat a King
-                regicide = True
-            board[my][mx] = ' '
-        # update to the King ?
-        toKing(board, y2, x2, regicide)
-
-
-def upper(color):
-    if color in ['b', 'B']:
-        return 'B'
-    if color in ['w', 'W']:
-        return 'W'
-
-
-def op(color):
-    if color in ['b', 'B']:
-        return 'w'
-    if color in ['w', 'w']:
-        return 'b'
-
-
-# AI function
-def gameOver(board):
-    b, w = 0, 0
-    for y in range(N):
-        for x in range(N):
-            if board[y][x] in ['b', 'B']:
-                b += 1
-            if board[y][x] in ['w', 'W']:
-                w += 1
-    if b == 0:
-        print("White win!")
-        return 'w'  # w win
-    if w == 0:
-        print("Black win!")
-        return 'b'  # b win
-    return None
-
+        return False
+
+    # per ply: (ply, number of cutoffs, rate of cutoffs on the first move)
+    def cutoffRates(self):
+        return [(ply, self.cutoffs[ply], self.firstCutoffs[ply] / self.cutoffs[ply])
+                for ply in range(MAX_PLY) if self.cutoffs[ply]]
+
+    # one of the best moves of the book, None if the position is not in it
+    def probeBook(self, pos, color):
+        if self.book is None:
+            return None
+        legal = legalMoveSet(pos, color)
+        paths = [path for path in self.book.probe(pos) if path in legal]
+        return random.choice(paths) if paths else None
+
+    # the best move by the tablebase, None if the position is not in it
+    def probeRoot(self, pos, color):
+        tb = self.tb
+        if tb is None or pos.blackMen + pos.blackKings + pos.whiteMen + pos.whiteKings > tb.maxPieces:
+            return None
+        bestScore, bestPath = None, None
+        for path in getAllMoves(pos, color):
+            undo = makeMove(pos, path)
+            if gameOver(pos) is not None:
+                score = 99999
+            else:
+                value = tb.probe(pos, op(color))
+                score = None if value is None else -tbScore(value)
+            unmakeMove(pos, undo)
+            if score is None:
+                return None
+            if bestScore is None or score > bestScore:
+                bestScore, bestPath = score, path
+        return bestPath
+
+    # minimax function, to get the best move and score
+    def minimax(self, pos, depth, max_depth, color, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 255 == 0 and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        # game over
+        win = gameOver(pos)
+        if win in ['b', 'w']:
+            if (win == color and depth % 2 == 0) or (win != color and depth % 2 != 0):
+                return 99999
+            else:
+                return -99999
+
+        # repeated position or draw rule
+        if depth > 0 and self.quiet >= 4 and self.drawn(pos):
+            return 0
+
+        # few pieces left: the tablebase knows the result
+        tb = self.tb
+        if tb is not None and depth > 0 and \
+                pos.blackMen + pos.blackKings + pos.whiteMen + pos.whiteKings <= tb.maxPieces:
+            value = tb.probe(pos, color)
+            if value is not None:
+                return tbScore(value) if depth % 2 == 0 else -tbScore(value)
+
+        # meet the max search depth
+        if depth >= max_depth:
+            self.leaves += 1
+            score = evaluate(pos, color)
+            if depth % 2 == 0:
+                return score
+            else:
+                return -score
+
+        # the table keeps scores for the side to move, the search for the root side
+        sign = 1 if depth % 2 == 0 else -1
+        tt = self.tt
+        entry = tt.probe(pos.hash) if tt is not None else None
+        if entry is not None and depth > 0 and entry[1] >= max_depth - depth:
+            score, flag = sign * entry[2], entry[3]
+            if sign < 0 and flag != EXACT:
+                flag = LOWER if flag == UPPER else UPPER
+            if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                return score
+        alpha0, beta0 = alpha, beta
+
+        # go through each possible move, the principal variation and the move of the table first
+        first = self.pv.get(pos.hash)
+        if first is None and entry is not None:
+            first = entry[4]
+        paths = self.pickMoves(pos, depth, color, first)
+        maxScore, minScore = -99999, 99999
+        bestPath = None
+        if depth == max_depth - 1 and BATCH_EVAL:
+            maxScore, bestPath = self.frontier(pos, list(paths), depth, color)
+            minScore = maxScore
+            paths = []
+        quiet = self.quiet
+        self.hashes.append(pos.hash)
+        for i, path in enumerate(paths):
+            if depth == 1 and self.alphaSlot is not None and POOL_ALPHAS[self.alphaSlot] > alpha:
+                # another worker found a better root move, narrow the window
+                alpha = alpha0 = POOL_ALPHAS[self.alphaSlot]
+                if alpha >= beta:
+                    break
+            self.quiet = quiet + 1 if not path >> 10 and pos.kings >> (path & 31) & 1 else 0
+            undo = makeMove(pos, path)
+            score = self.minimax(pos, depth + 1, max_depth, op(color), alpha, beta)
+            unmakeMove(pos, undo)
+            if depth % 2 == 0:
+                if maxScore < score or bestPath is None:
+                    maxScore = score
+                    bestPath = path
+                alpha = max(alpha, score)
+            else:
+                if minScore > score or bestPath is None:
+                    minScore = score
+                    bestPath = path
+                beta = min(beta, score)
+
+            if alpha >= beta:  # alpha-beta prun
+                self.cutoffs[depth] += 1
+                if i == 0:
+                    self.firstCutoffs[depth] += 1
+                if not path >> 10:  # a quiet move, remember it
+                    killers = self.killers[depth]
+                    if killers[0] != path:
+                        killers[1] = killers[0]
+                        killers[0] = path
+                    self.history[path] += (max_depth - depth) ** 2
+                break
+        self.hashes.pop()
+        self.quiet = quiet
+
+        if depth == 0 and bestPath is not None:
+            self.path = bestPath
+        score = maxScore if depth % 2 == 0 else minScore
+
+        if tt is not None:
+            if score <= alpha0:
+                flag = UPPER
+            elif score >= beta0:
+                flag = LOWER
+            else:
+                flag = EXACT
+            if sign < 0 and flag != EXACT:
+                flag = LOWER if flag == UPPER else UPPER
+            tt.store(pos.hash, max_depth - depth, sign * score, flag, bestPath)
 
-def evaluation(board, color):
-    score = 0
-    for y in range(N):
-        for x in range(N):
-            if board[y][x] == 'B':
-                score += 10
-            if board[y][x] == 'b':
-                score += 1
-            if board[y][x] == 'W':
-                score -= 10
-            if board[y][x] == 'w':
-                score -= 1
-    if color == 'b':
         return score
-    else:
-        return -score
-
-
-# the checker become the King ?
-def toKing(board, y, x, regicide):
-    if board[y][x] == 'b' and (y == N - 1 or regicide):
-        board[y][x] = 'B'
-    if board[y][x] == 'w' and (y == 0 or regicide):
-        board[y][x] = 'W'
-
-
-# get all the valid moves: first jump. if no jump, then move
-def getAllMoves(board, color='b'):
-    # use dfs to get all the jumps
-    def dfs(board, path, y, x, paths):
-        color = board[y][x]
-        dir = [[-1, -1], [-1, 1], [1, -1], [1, 1]]
-        jump_num = 0
-        for k in range(len(dir)):  # try 4 directions from (y,x)
-            if color == 'b' and dir[k][0] < 0:
-                continue  # 'b' can only move down
-            if color == 'w' and dir[k][0] > 0:
-                continue  # 'w' can only move up
-
-            my, mx = y + dir[k][0], x + dir[k][1]
-            ey, ex = y + 2 * dir[k][0], x + 2 * dir[k][1]
-            if 0 <= ey < N and 0 <= ex < N:
-                color2 = board[my][mx]
-                regicide = False  # eat the King ?
-                if color in ['b', 'w'] and color2 in ['B', 'W']:
-                    regicide = True
-                # jump from (y,x), by (my,mx), to (ey,ex)
-                if color2 in [op(color), upper(op(color))] and board[ey][ex] == ' ':
-                    jump_num += 1
-                    board[y][x], board[my][mx], board[ey][ex] = ' ', ' ', board[y][x]
-                    path.append((y, x))
-
-                    if regicide:
-                        P = [xy for xy in path]
-                        P.append((ey, ex))
-                        paths.append(P)
-                    else:
-                        dfs(board, path, ey, ex, paths)
-
-                    # recover
-                    board[y][x], board[my][mx], board[ey][ex] = board[ey][ex], color2, ' '
-                    del path[-1]
-
-        # if jump_num == 0 and len(path)>=1:
-        if len(path) >= 1:
-            P = [xy for xy in path]
-            P.append((y, x))
-            paths.append(P)
-
-    def getJumpPaths(board, color='b'):
-        paths = []
-
-        # for 'b', search from bottom to up
-        # for 'w', search from up to bottom
-        sy, ty, dy = N - 1, -1, -1
-        if color == 'w':
-            sy, ty, dy = 0, N, 1
-        y = sy
-        while y != ty:
-            for x in range(N):
-                if board[y][x] in [color, upper(color)]:
-                    path = []
-                    dfs(board, path, y, x, paths)
-            y += dy
-        return paths
-
-    def getMovePaths(board, color='b'):
-        paths = []
-        dir = [[-1, -1], [-1, 1], [1, -1], [1, 1]]
-
-        # for 'b', search from bottom to up
-        # for 'w', search from up to bottom
-        sy, ty, dy = N - 1, -1, -1
-        if color == 'w':
-            sy, ty, dy = 0, N, 1
-        y = sy
-        while y != ty:
-            for x in range(N):
-                if board[y][x] in [color, upper(color)]:
-                    for k in range(len(dir)):
-                        if color == 'b' and dir[k][0] < 0: continue  # 'b' can only move down
-                        if color == 'w' and dir[k][0] > 0: continue  # 'w' can only move up
-                        ey, ex = y + dir[k][0], x + dir[k][1]
-                        if 0 <= ey < N and 0 <= ex < N and board[ey][ex] == ' ':
-                            paths.append([(y, x), (ey, ex)])
-
-            y += dy
-        return paths
-
-    # first get all the Jump
-    paths = getJumpPaths(board, color)
-    if paths:
-        return paths
-
-    # if no Jump, get the Move
-    return getMovePaths(board, color)
-
-
-# minimax function, to get the best move and score
-def minimax(board, depth, max_depth, color, alpha, beta):
-    global AI_path
-    # game over
-    win = gameOver(board)
-    if win in ['b', 'w']:
-        if (win == color and depth % 2 == 0) or (win != color and depth % 2 != 0):
-            return 99999
-        else:
-            return -99999
 
-    # meet the max search depth
-    if depth >= max_depth:
-        score = evaluation(board, color)
-        if depth % 2 == 0:
-            return score
+    # the children of pos are leaves: score them all in one evaluateBatch call,
+    # return (score, best path) like the move loop of minimax would
+    def frontier(self, pos, paths, depth, color):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        if not paths:  # no move left, a loss for the side to move
+            return (-99999 if depth % 2 == 0 else 99999), None
+        self.nodes += len(paths)
+        tb = self.tb
+        rootColor = color if depth % 2 == 0 else op(color)
+        scores = [None] * len(paths)
+        black, white, kings, leaves = [], [], [], []
+        quiet = self.quiet
+        self.hashes.append(pos.hash)
+        for i, path in enumerate(paths):
+            self.quiet = quiet + 1 if not path >> 10 and pos.kings >> (path & 31) & 1 else 0
+            undo = makeMove(pos, path)
+            win = gameOver(pos)
+            if win is not None:
+                scores[i] = 99999 if win == rootColor else -99999
+            elif self.quiet >= 4 and self.drawn(pos):
+                scores[i] = 0
+            elif tb is not None and pos.blackMen + pos.blackKings + pos.whiteMen + pos.whiteKings <= tb.maxPieces:
+                value = tb.probe(pos, op(color))
+                if value is not None:
+                    scores[i] = tbScore(value) if depth % 2 == 1 else -tbScore(value)
+            if scores[i] is None:
+                black.append(pos.black)
+                white.append(pos.white)
+                kings.append(pos.kings)
+                leaves.append(i)
+            unmakeMove(pos, undo)
+        self.hashes.pop()
+        self.quiet = quiet
+        if leaves:
+            self.leaves += len(leaves)
+            for i, score in zip(leaves, evaluateBatch(encode(black, white, kings), rootColor).tolist()):
+                scores[i] = score
+        best = max(scores) if depth % 2 == 0 else min(scores)
+        return best, paths[scores.index(best)]
+
+    # principal variation search in negamax form: the score is for color, the side to
+    # move. The first move gets the full window, the others a null window that only
+    # proves them worse, and are searched again if they turn out better.
+    def pvSearch(self, pos, depth, max_depth, color, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 255 == 0 and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        win = gameOver(pos)
+        if win is not None:
+            return 99999 if win == color else -99999
+
+        if depth > 0 and self.quiet >= 4 and self.drawn(pos):
+            return 0
+
+        tb = self.tb
+        if tb is not None and depth > 0 and \
+                pos.blackMen + pos.blackKings + pos.whiteMen + pos.whiteKings <= tb.maxPieces:
+            value = tb.probe(pos, color)
+            if value is not None:
+                return tbScore(value)
+
+        if depth >= max_depth:
+            self.leaves += 1
+            return evaluate(pos, color)
+
+        tt = self.tt
+        entry = tt.probe(pos.hash) if tt is not None else None
+        if entry is not None and depth > 0 and entry[1] >= max_depth - depth:
+            score, flag = entry[2], entry[3]
+            if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                return score
+        alpha0 = alpha
+
+        first = self.pv.get(pos.hash)
+        if first is None and entry is not None:
+            first = entry[4]
+        paths = self.pickMoves(pos, depth, color, first)
+        bestScore, bestPath = -99999, None
+        quiet = self.quiet
+        self.hashes.append(pos.hash)
+        for i, path in enumerate(paths):
+            self.quiet = quiet + 1 if not path >> 10 and pos.kings >> (path & 31) & 1 else 0
+            undo = makeMove(pos, path)
+            if i == 0:
+                score = -self.pvSearch(pos, depth + 1, max_depth, op(color), -beta, -alpha)
+            else:
+                score = -self.pvSearch(pos, depth + 1, max_depth, op(color), -alpha - 1, -alpha)
+                if alpha < score < beta:  # better than the first move, get its exact score
+                    score = -self.pvSearch(pos, depth + 1, max_depth, op(color), -beta, -alpha)
+            unmakeMove(pos, undo)
+            if score > bestScore or bestPath is None:
+                bestScore, bestPath = score, path
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.cutoffs[depth] += 1
+                if i == 0:
+                    self.firstCutoffs[depth] += 1
+                if not path >> 10:  # a quiet move, remember it
+                    killers = self.killers[depth]
+                    if killers[0] != path:
+                        killers[1] = killers[0]
+                        killers[0] = path
+                    self.history[path] += (max_depth - depth) ** 2
+                break
+        self.hashes.pop()
+        self.quiet = quiet
+
+        if depth == 0 and bestPath is not None:
+            self.path = bestPath
+
+        if tt is not None:
+            if bestScore <= alpha0:
+                flag = UPPER
+            elif bestScore >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+            tt.store(pos.hash, max_depth - depth, bestScore, flag, bestPath)
+
+        return bestScore
+
+    # search the root in a window around the score of the previous iteration, widen it
+    # and search again while the score falls outside
+    def aspiration(self, pos, depth, color, guess):
+        delta = ASPIRATION
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            score = self.pvSearch(pos, 0, depth, color, alpha, beta)
+            if score <= alpha:
+                alpha = max(score - delta, -999999)
+            elif score >= beta:
+                beta = min(score + delta, 999999)
+            else:
+                return score
+            delta *= 2
+
+    # exact score of every move of the position, searched to depth (used to build the book)
+    def scoreMoves(self, pos, color, depth):
+        self.pv = {}
+        scores = []
+        for path in getAllMoves(pos, color):
+            undo = makeMove(pos, path)
+            scores.append((self.minimax(pos, 1, depth, op(color), -999999, 999999), path))
+            unmakeMove(pos, undo)
+        return scores
+
+    # follow the best moves of the table from the root to get the principal variation
+    def getPV(self, pos, color, length):
+        pv = {}
+        undos = []
+        for i in range(length):
+            entry = self.tt.probe(pos.hash)
+            if entry is None or entry[4] is None or pos.hash in pv or entry[4] not in legalMoveSet(pos, color):
+                break
+            pv[pos.hash] = entry[4]
+            undos.append(makeMove(pos, entry[4]))
+            color = op(color)
+        for undo in reversed(undos):
+            unmakeMove(pos, undo)
+        return pv
+
+    # search the root moves in parallel on the pool, sharing the best score as alpha
+    def parallelMinimax(self, pos, depth, color):
+        paths = getAllMoves(pos, color)
+        if len(paths) < 2 or depth < 2:
+            return self.minimax(pos, 0, depth, color, -999999, 999999)
+        self.orderMoves(pos, paths, 0, color, self.pv.get(pos.hash, self.path or None))  # previous iteration first
+        slot = FREE_SLOTS.get()
+        futures = []
+        try:
+            POOL_ALPHAS[slot] = -999999
+            hashes = self.hashes + [pos.hash]
+            futures = [POOL.submit(searchRootMove, pos.black, pos.white, pos.kings, color, path, depth,
+                                   self.deadline, slot, hashes,
+                                   self.quiet + 1 if not path >> 10 and pos.kings >> (path & 31) & 1 else 0,
+                                   self.drawPlies)
+                       for path in paths]
+            bestScore, bestPath = None, None
+            for path, future in zip(paths, futures):
+                result = future.result()
+                if result is None:
+                    for f in futures:
+                        f.cancel()
+                    raise SearchTimeout()
+                score, exact, counters = result
+                self.nodes += counters[0]
+                self.leaves += counters[1]
+                for i in range(4):
+                    self.poolCounts[i] += counters[2 + i]
+                if exact and (bestScore is None or score > bestScore):
+                    bestScore, bestPath = score, path
+        finally:
+            for f in futures:
+                f.cancel()
+            FREE_SLOTS.put(slot)
+        self.path = bestPath
+        return bestScore
+
+    # best move (packed, None if there is no move) for color on the bitboard.Position.
+    # With time_ms or deadline (a time.time() value) the search deepens iteratively up to
+    # search_depth and returns the best move of the last iteration finished in time.
+    # With parallel the root moves are spread over the worker pool (see startPool).
+    # history is the bitboard.GameHistory of the game up to pos, for the draws by
+    # repetition and by the draw rule. pos itself is left as it is: a timeout leaves the
+    # search in the middle of its moves, so it searches a copy.
+    def search(self, pos, color, search_depth, time_ms=None, deadline=None, parallel=False, history=None):
+        self.reset()
+        if history is not None and history.hashes[-1] == pos.hash:
+            self.hashes = history.hashes[:-1]
+            self.quiet = len(self.hashes)
+            self.drawPlies = history.drawPlies
+        stats = self.stats = SearchStats(color)
+        start = time.time()
+        tt = self.tt
+        probes, hits = (tt.probes, tt.hits) if tt is not None else (0, 0)
+        alpha, beta = -999999, 999999
+        bookPath = self.probeBook(pos, color)
+        if bookPath is not None:
+            stats.source = 'book'
         else:
-            return -score
-
-    # go through each possible move
-    paths = getAllMoves(board, color)
-    maxScore, minScore = -99999, 99999
-    for path in paths:
-        board2 = [[board[y][x] for x in range(N)] for y in range(N)]
-        makeMove(board2, path)
-
-        score = minimax(board2, depth + 1, max_depth, op(color), alpha, beta)
-        if depth % 2 == 0:
-            if maxScore < score:
-                maxScore = score
-                if depth == 0: AI_path = path
-            alpha = max(alpha, score)
+            bookPath = self.probeRoot(pos, color)
+            if bookPath is not None:
+                stats.source = 'tablebase'
+        root = pos.copy()
+        if parallel:
+            startPool()
+            search = lambda depth: self.parallelMinimax(root, depth, color)
+        elif self.pvs:
+            search = lambda depth: self.pvSearch(root, 0, depth, color, alpha, beta)
         else:
-            minScore = min(minScore, score)
-            beta = min(beta, score)
-
-        if alpha >= beta:  # alpha-beta prun
-            break
-
-    if depth % 2 == 0:
-        return maxScore
-    else:
-        return minScore
-
-
-def callMinimax(board, color, search_depth):
-    global AI_path
-
-    alpha, beta = -999999, 999999
-    AI_path = []
-    minimax(board, 0, search_depth, color, alpha, beta)
+            search = lambda depth: self.minimax(root, 0, depth, color, alpha, beta)
+        if bookPath is not None:  # known from the book or the tablebase
+            self.path = bookPath
+        elif time_ms is None and deadline is None:
+            stats.score = search(search_depth)
+            self.depth = search_depth
+            stats.depthNodes.append(self.nodes)
+            stats.depthTimes.append(time.time() - start)
+        else:
+            if time_ms is not None:
+                stop = time.time() + time_ms / 1000.0
+                deadline = stop if deadline is None else min(deadline, stop)
+            best = None
+            score = 0
+            for depth in range(1, search_depth + 1):
+                self.deadline = deadline if depth > 1 else None  # always finish depth 1
+                nodes, t = self.nodes, time.time()
+                try:
+                    if self.pvs and not parallel and depth > 2 and abs(score) < TB_WIN - MAX_PLY:
+                        score = self.aspiration(root, depth, color, score)
+                    else:
+                        score = search(depth)
+                except SearchTimeout:
+                    break
+                best = self.path
+                self.depth = depth
+                stats.score = score
+                stats.depthNodes.append(self.nodes - nodes)
+                stats.depthTimes.append(time.time() - t)
+                self.pv = self.getPV(root, color, depth)
+                if abs(score) >= 99999:  # the game is decided, no need to go deeper
+                    break
+            self.deadline = None
+            self.path = best
+
+        stats.move = moveToPath(unpackMove(pos, self.path)) if self.path is not None else []
+        stats.depth = self.depth
+        stats.time = time.time() - start
+        stats.nodes, stats.leaves = self.nodes, self.leaves
+        stats.cutoffs = sum(self.cutoffs) + self.poolCounts[0]
+        stats.firstCutoffs = sum(self.firstCutoffs) + self.poolCounts[1]
+        if tt is not None:
+            stats.ttProbes = tt.probes - probes + self.poolCounts[2]
+            stats.ttHits = tt.hits - hits + self.poolCounts[3]
+        return self.path
+
+
+# Search on the opponent's time: while color thinks about its move, guess its likely
+# replies with a short search, then answer each of them deeper and deeper in a
+# background thread until stop. The answers go to a cache and to the table.
+class Ponderer:
+    def __init__(self, table=None, depth=MAX_PLY, replies=4, guessDepth=4):
+        self.table = table if table is not None else TranspositionTable()
+        self.depth = depth  # deepest answer searched
+        self.replies = replies  # number of replies of the opponent answered
+        self.guessDepth = guessDepth  # depth of the search that ranks the replies
+        self.cache = {}  # position hash -> (best move, depth) of our answer
+        self.engine = None
+        self.thread = None
+
+    # start pondering on pos, color (the opponent) to move
+    def start(self, pos, color):
+        self.stop()
+        self.cache = {}
+        self.engine = Engine(self.table)
+        self.engine.deadline = math.inf  # stop sets it to 0
+        self.thread = threading.Thread(target=self.run, args=(pos.copy(), color), daemon=True)
+        self.thread.start()
+
+    def run(self, pos, color):
+        engine = self.engine
+        try:
+            scores = engine.scoreMoves(pos, color, self.guessDepth)
+            scores.sort(key=lambda scored: -scored[0])
+            children = []
+            for score, path in scores[:self.replies]:
+                child = pos.copy()
+                makeMove(child, path)
+                children.append(child)
+            for depth in range(1, self.depth + 1):
+                for child in children:
+                    engine.path = None
+                    engine.minimax(child, 0, depth, op(color), -999999, 999999)
+                    if engine.path is not None:
+                        self.cache[child.hash] = (engine.path, depth)
+        except SearchTimeout:
+            pass
+
+    # stop pondering, return the cached (best move, depth) for pos or None
+    def stop(self, pos=None):
+        if self.thread is not None:
+            self.engine.deadline = 0
+            self.thread.join()
+            self.thread = None
+        return self.cache.get(pos.hash) if pos is not None else None
+
+
+def _initWorker(alphas):
+    global POOL_ALPHAS
+    POOL_ALPHAS = alphas
+
+
+def _warmUp(i):
+    global WORKER_ENGINE
+    if WORKER_ENGINE is None:
+        WORKER_ENGINE = Engine(TranspositionTable(WORKER_TT_MB))
+    return os.getpid()
+
+
+# start the worker processes once, so they are not forked for every move
+def startPool(workers=None):
+    global POOL, POOL_WORKERS, POOL_ALPHAS, FREE_SLOTS
+    with POOL_LOCK:
+        if POOL is not None:
+            return
+        workers = POOL_WORKERS = workers or os.cpu_count() or 1
+        POOL_ALPHAS = multiprocessing.Array('i', [-999999] * POOL_SLOTS)
+        FREE_SLOTS = queue.Queue()
+        for slot in range(POOL_SLOTS):
+            FREE_SLOTS.put(slot)
+        POOL = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(POOL_ALPHAS,))
+        list(POOL.map(_warmUp, range(workers)))
+
+
+def stopPool():
+    global POOL, POOL_WORKERS, POOL_ALPHAS, FREE_SLOTS
+    with POOL_LOCK:
+        if POOL is not None:
+            POOL.shutdown()
+        POOL, POOL_WORKERS, POOL_ALPHAS, FREE_SLOTS = None, 0, None, None
+
+
+# run in a worker: search one root move, return (score, exact ?, counters) or None on
+# timeout, with the counters (nodes, leaves, cutoffs, first move cutoffs, TT probes, TT hits).
+# hashes, quiet and drawPlies are the draw state after the move, see Engine.drawn.
+def searchRootMove(black, white, kings, color, path, depth, deadline, slot, hashes=(), quiet=0,
+                   drawPlies=DRAW_PLIES):
+    _warmUp(0)
+    engine = WORKER_ENGINE
+    engine.hashes, engine.quiet, engine.drawPlies = list(hashes), quiet, drawPlies
+    engine.pv = {}
+    engine.nodes = engine.leaves = 0
+    for ply in range(MAX_PLY):
+        engine.cutoffs[ply] = engine.firstCutoffs[ply] = 0
+    probes, hits = engine.tt.probes, engine.tt.hits
+    engine.alphaSlot = slot
+    pos = Position(black, white, kings, color)
+    makeMove(pos, path)
+    engine.deadline = deadline
+    try:
+        score = engine.minimax(pos, 1, depth, op(color), POOL_ALPHAS[slot], 999999)
+    except SearchTimeout:
+        return None
+    finally:
+        engine.deadline = None
+    # a score not above the best one is only an upper bound
+    with POOL_ALPHAS.get_lock():
+        exact = score > POOL_ALPHAS[slot]
+        if exact:
+            POOL_ALPHAS[slot] = score
+    return score, exact, (engine.nodes, engine.leaves, sum(engine.cutoffs), sum(engine.firstCutoffs),
+                          engine.tt.probes - probes, engine.tt.hits - hits)
+
+
+# run in a worker: search a whole position with the table of the worker, return
+# (move, depth, score, nodes), see server.py
+def searchPosition(black, white, kings, color, depth, time_ms):
+    _warmUp(0)
+    engine = WORKER_ENGINE
+    engine.alphaSlot = None
+    path = engine.search(Position(black, white, kings, color), color, depth, time_ms)
+    return path, engine.depth, engine.stats.score, engine.nodes
+
+
+# table is a TranspositionTable to reuse across turns, a new one is used if None.
+# With stats the result is (path, SearchStats), stats_file (a path or an open file)
+# gets the SearchStats of the move appended as one JSON line.
+# See Engine.search for the other arguments.
+def callMinimax(board, color, search_depth, table=None, time_ms=None, deadline=None, parallel=False,
+                stats=False, stats_file=None, history=None):
+    engine = Engine(table)
+    pos = fromBoard(board, color)
+    move = engine.search(pos, color, search_depth, time_ms, deadline, parallel, history)
+    AI_path = moveToPath(unpackMove(pos, move)) if move is not None else []
+    if stats_file is not None:
+        if isinstance(stats_file, str):
+            with open(stats_file, 'a') as f:
+                engine.stats.write(f)
+        else:
+            engine.stats.write(stats_file)
     if color == 'b' and AI_path == []:
         print("White win!")
-        return AI_path
     elif color == 'w' and AI_path == []:
         print("Black win!")
-        return AI_path
     else:
-        print('AI: ', AI_path)
+        print('AI: ', AI_path, 'depth', engine.depth)
 
+    if stats:
+        return AI_path, engine.stats
     return AI_path
 
 
-board = [[' ', 'b', ' ', 'b', ' ', 'b', ' ', 'b', ],
-         ['b', ' ', 'b', ' ', 'b', ' ', 'b', ' ', ],
-         [' ', 'b', ' ', 'b', ' ', 'b', ' ', 'b', ],
-         [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ],
-         [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ],
-         ['w', ' ', 'w', ' ', 'w', ' ', 'w', ' ', ],
-         [' ', 'w', ' ', 'w', ' ', 'w', ' ', 'w', ],
-         ['w', ' ', 'w', ' ', 'w', ' ', 'w', ' ', ]]
-player_move = [(2, 1), (3, 1)]
-if not canMove(board, player_move, 'b'):
-    print('false')
-"""path = callMinimax(board, 'b', 2)
-makeMove(board, path)
-b = [''.join(line) for line in board]
-b = '\n'.join(b)
-print(b)"""
+if __name__ == '__main__':
+    board = initBoard()
+    player_move = [(2, 1), (3, 1)]
+    if not canMove(board, player_move, 'b'):
+        print('false')
+    path = callMinimax(board, 'b', 2)
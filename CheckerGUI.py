@@ -1,6 +1,10 @@
 import tkinter as tk
 from tkinter import messagebox
 from camera_tracker import CameraTracker
+from AI import Engine, Ponderer, checkMove
+from bitboard import (MOVE_OK, MOVE_REASONS, OFF_BOARD, GameHistory, fromBoard, legalMoveSet, moveToPath,
+                      toSquare, unpackMove)
+from transposition import TranspositionTable
 
 # Constants for the game
 BOARD_SIZE = 8
@@ -12,6 +16,12 @@ MARKER_COLOR = "green"  # Color for the corner markers
 MARKER_SIZE = 10  # Size of the corner markers
 PADDING = 10  # Extra padding for the canvas to accommodate markers
 
+# AI search
+AI_DEPTH = 12  # Depth of the AI search, a pondered answer at least this deep is played at once
+AI_TIME_MS = 2000  # Time budget of the AI search
+TABLE_MB = 64  # Transposition table kept for the whole game, filled while pondering too
+STATS_FILE = None  # File to append the statistics of each AI search to, as JSON lines
+
 # Directions for movement
 DIRECTIONS = {
     'P1': [(1, -1), (1, 1)],  # Down-left, down-right
@@ -90,37 +100,41 @@ class CheckersGame:
     def switch_player(self):
         self.current_player = 'P2' if self.current_player == 'P1' else 'P1'
 
-    def ai_move(self):
-        # Simple AI: Randomly pick a move from available pieces
-        import random
-
-        valid_pieces = []
+    def to_ai_board(self):
+        """Return the board in the format of AI.py: P1 is 'b', P2 is 'w', kings in upper case."""
+        board = [[' ' for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
         for row in range(BOARD_SIZE):
             for col in range(BOARD_SIZE):
                 piece = self.board[row][col]
-                if piece and piece.player == self.current_player:
-                    moves = self.get_valid_moves(row, col)
-                    if moves:
-                        for move in moves:
-                            if len(move) == 4:  # It's a jump move
-                                valid_pieces.insert(0, (row, col, move))  # Prioritize jumps
-                            else:
-                                valid_pieces.append((row, col, move))
-
-        if valid_pieces:
-            from_row, from_col, move = valid_pieces[0]
-            if len(move) == 4:  # Jump move
-                to_row, to_col, mid_row, mid_col = move
-                self.board[mid_row][mid_col] = None  # Remove captured piece
-                # Inform user to remove their piece
-                self.captured_piece = (mid_row, mid_col)
-            else:
-                to_row, to_col = move
-                self.captured_piece = None
+                if piece:
+                    name = 'b' if piece.player == 'P1' else 'w'
+                    board[row][col] = name.upper() if piece.is_king else name
+        return board
 
-            self.move_piece(from_row, from_col, to_row, to_col)
-            return from_row, from_col, to_row, to_col
-        return None
+    def ai_move(self, path):
+        """
+        Play a whole move, the AI move found by AI.py or the user move matched by find_user_move.
+        Args:
+            path (list): (row, col) squares visited by the moving piece.
+        """
+        if not path:
+            return None
+        from_row, from_col = path[0]
+        piece = self.board[from_row][from_col]
+        self.captured_pieces = []
+        took_king = False
+        for (row, col), (to_row, to_col) in zip(path, path[1:]):
+            if abs(to_row - row) == 2:  # Jump, move_piece removes the captured piece
+                mid_row, mid_col = (row + to_row) // 2, (col + to_col) // 2
+                took_king = took_king or self.board[mid_row][mid_col].is_king
+                self.captured_pieces.append((mid_row, mid_col))
+            self.move_piece(row, col, to_row, to_col)
+        if took_king:  # A man capturing a king is crowned
+            piece.promote()
+        # Inform user to remove their piece(s)
+        self.captured_piece = self.captured_pieces[0] if self.captured_pieces else None
+        to_row, to_col = path[-1]
+        return from_row, from_col, to_row, to_col
 
     def update_board_with_physical_pieces(self, piece_positions):
         """
@@ -152,6 +166,10 @@ class CheckersGUI:
         self.info_panel = tk.Label(self.root, text="Initializing game...", height=2)
         self.info_panel.pack()
 
+        # The AI ponders on the user's time, see start_pondering
+        self.table = TranspositionTable(TABLE_MB)
+        self.ponderer = Ponderer(self.table)
+
         # Initialize camera tracker
         self.camera_tracker = CameraTracker()
         # Capture initial board state
@@ -174,6 +192,34 @@ class CheckersGUI:
             self.game.update_board_with_physical_pieces(self.current_piece_positions)
             self.info_panel.config(text="Game initialized. Press 'Space' after making your move.")
             self.root.bind("<space>", self.confirm_move)
+            # The positions of the game, for the draws by repetition and by the draw rule
+            self.history = GameHistory(fromBoard(self.game.to_ai_board(), 'b'))
+            self.start_pondering()
+
+    def check_draw(self, color):
+        """
+        Add the position to the game history and declare the draw if the game is drawn.
+        Args:
+            color (str): 'b' or 'w', the side to move in the position.
+        Returns:
+            bool: True if the game is a draw.
+        """
+        self.history.push(fromBoard(self.game.to_ai_board(), color))
+        reason = self.history.draw()
+        if reason is None:
+            return False
+        if reason == 'repetition':
+            text = f"Draw: the same position came back {self.history.repetitions} times."
+        else:
+            text = f"Draw: {self.history.drawPlies} plies without a capture or a man move."
+        self.info_panel.config(text=text)
+        self.ponderer.stop()
+        self.root.unbind("<space>")
+        return True
+
+    def start_pondering(self):
+        """Search the likely user moves and the AI answers while the user thinks."""
+        self.ponderer.start(fromBoard(self.game.to_ai_board(), 'b'), 'b')
 
     def draw_board(self):
         self.canvas.delete("all")
@@ -232,6 +278,9 @@ class CheckersGUI:
             self.info_panel.config(text="No pieces detected. Try again.")
             return
 
+        # The board before the user's move, to check it
+        board_before = self.game.to_ai_board()
+
         # Update the game board with the new positions
         self.game.update_board_with_physical_pieces(self.current_piece_positions)
 
@@ -249,20 +298,20 @@ class CheckersGUI:
             if len(moved_pieces) == 2:
                 from_pos = list(previous_set - current_set)[0]
                 to_pos = list(current_set - previous_set)[0]
-                from_row, from_col = from_pos
-                to_row, to_col = to_pos
-                # Validate the move
-                valid_moves = self.game.get_valid_moves(from_row, from_col)
-                if (to_row, to_col) in [(m[0], m[1]) if len(m) == 2 else (m[0], m[1]) for m in valid_moves]:
-                    # Move is valid
-                    self.game.move_piece(from_row, from_col, to_row, to_col)
+                # Validate the move against the rules of the AI
+                path, reason = self.find_user_move(board_before, from_pos, to_pos)
+                if reason == MOVE_OK:
+                    # Move is valid, play the whole chain on the board as it was before
+                    self.game.update_board_with_physical_pieces(self.previous_piece_positions)
+                    self.game.ai_move(path)
                     self.game.switch_player()
-                    self.info_panel.config(text="Valid move. AI is thinking...")
                     self.draw_board()
-                    self.root.after(500, self.ai_turn)
+                    if not self.check_draw('w'):
+                        self.info_panel.config(text="Valid move. AI is thinking...")
+                        self.root.after(500, self.ai_turn)
                 else:
                     # Invalid move
-                    self.info_panel.config(text="Invalid move. Try again.")
+                    self.info_panel.config(text=f"Invalid move: {MOVE_REASONS[reason]}. Try again.")
                     # Revert to previous state
                     self.game.update_board_with_physical_pieces(self.previous_piece_positions)
                     self.draw_board()
@@ -277,24 +326,61 @@ class CheckersGUI:
 
         self.previous_piece_positions = self.current_piece_positions.copy()
 
+    def find_user_move(self, board, from_pos, to_pos):
+        """
+        Find the legal move of the user from the two squares the camera sees.
+        Args:
+            board (list): The board before the move, in the format of AI.py.
+            from_pos (tuple): (row, col) the piece left.
+            to_pos (tuple): (row, col) the piece stopped on, the end of a whole chain of jumps.
+        Returns:
+            tuple: (path, reason), path the (row, col) squares visited by the piece (None
+            if the move is not legal) and reason a MOVE_REASONS code.
+        """
+        reason = checkMove(board, [from_pos, to_pos], 'b')
+        if reason == OFF_BOARD:
+            return None, reason
+        pos = fromBoard(board, 'b')
+        frm, to = toSquare(*from_pos), toSquare(*to_pos)
+        # Chains taking other pieces to the same square look the same to the camera,
+        # the first one is played
+        moves = sorted(move for move in legalMoveSet(pos, 'b') if move & 31 == frm and move >> 5 & 31 == to)
+        if not moves:
+            return None, reason
+        return moveToPath(unpackMove(pos, moves[0])), MOVE_OK
+
     def ai_turn(self):
         if self.game.current_player == 'P2':
-            move = self.game.ai_move()
+            pos = fromBoard(self.game.to_ai_board(), 'w')
+            pondered = self.ponderer.stop(pos)
+            if pondered is not None and pondered[1] >= AI_DEPTH:
+                path = pondered[0]  # The user played a move we already answered
+            else:
+                engine = Engine(self.table)
+                path = engine.search(pos, 'w', AI_DEPTH, time_ms=AI_TIME_MS, history=self.history)
+                if STATS_FILE:
+                    with open(STATS_FILE, 'a') as f:
+                        engine.stats.write(f)
+            move = self.game.ai_move(moveToPath(unpackMove(pos, path)) if path is not None else [])
             if move:
                 from_row, from_col, to_row, to_col = move
                 self.info_panel.config(text=f"AI moved ({from_row}, {from_col}) to ({to_row}, {to_col})")
-                if self.game.captured_piece:
-                    cap_row, cap_col = self.game.captured_piece
-                    self.info_panel.config(text=f"AI captured your piece at ({cap_row}, {cap_col}). Please remove it.")
+                if self.game.captured_pieces:
+                    captured = ", ".join(f"({cap_row}, {cap_col})" for cap_row, cap_col in self.game.captured_pieces)
+                    self.info_panel.config(text=f"AI captured your piece at {captured}. Please remove it.")
             else:
                 self.info_panel.config(text="AI has no valid moves. You win!")
             self.game.switch_player()
             self.draw_board()
+            if move and self.check_draw('b'):
+                return
+            self.start_pondering()
         else:
             self.info_panel.config(text="Your turn. Make your move and press 'Space'.")
 
     def on_closing(self):
         """Handle application closing."""
+        self.ponderer.stop()
         self.camera_tracker.release()
         self.root.destroy()
 
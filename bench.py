@@ -0,0 +1,126 @@
+# Search benchmark: run callMinimax on a fixed set of positions at fixed depths and
+# compare the time to depth, the nodes and the chosen move with the baseline in bench.json.
+#
+#   python bench.py [--repeat n] [--tolerance t] [--pvs] [--update]
+#
+# A position is flagged when it got slower or searched more nodes than the baseline by more
+# than the tolerance (0.25 = 25 %), or when the chosen move changed. Times are the best of --repeat runs and
+# only comparable on the same machine: run --update on it before changing the engine. Runs
+# shorter than MIN_TIME are all timer noise, their time is not compared.
+# --pvs searches with principal variation search instead of the plain alpha-beta, to
+# compare its nodes with the baseline.
+
+import json
+import os
+import sys
+import time
+import AI
+from bitboard import fromBoard, moveToPath, unpackMove
+from perft import POSITIONS, toBoard
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.json')
+
+# name -> (rows, side to move), on top of the perft positions ('kings' of perft is a forced
+# win the search solves in a few nodes, 'crowned' stands for it)
+POSITIONS = dict(POSITIONS, **{
+    'opening': ([".b.b.b.b",
+                 "b.b.b.b.",
+                 ".....b.b",
+                 "..b.....",
+                 "...w....",
+                 "w...w.w.",
+                 ".w.w.w.w",
+                 "w.w.w.w."], 'b'),
+    'middle': ([".b...b.b",
+                "b.b.b...",
+                ".b...b..",
+                "..b.w...",
+                ".w...w..",
+                "w.w...w.",
+                ".....w.w",
+                "w.w.w..."], 'w'),
+    'kingfight': (["...b....",
+                   "........",
+                   ".W...b..",
+                   "........",
+                   ".....B..",
+                   "..w.....",
+                   "...w.w..",
+                   "..W....."], 'b'),
+    'crowned': ([".....b.b",
+                 "b.......",
+                 "...B.b..",
+                 "..b.....",
+                 ".w...W..",
+                 "..B.....",
+                 ".w...w.w",
+                 "w.W....."], 'b'),
+})
+
+# deep enough for a few tenths of a second each, shorter runs are too noisy to compare
+DEPTHS = {'start': 12, 'opening': 12, 'middle': 12, 'midgame': 13, 'crowned': 8,
+          'regicide': 14, 'endgame': 16, 'kingfight': 10}
+MIN_TIME = 0.05  # below this the times are not compared, only the nodes and the move
+
+
+# search the position once, return (seconds, nodes, move)
+def run(name, pvs=False):
+    rows, color = POSITIONS[name]
+    pos = fromBoard(toBoard(rows), color)
+    engine = AI.Engine(pvs=pvs)
+    start = time.perf_counter()
+    move = engine.search(pos, color, DEPTHS[name])
+    t = time.perf_counter() - start
+    return t, engine.nodes, [list(square) for square in moveToPath(unpackMove(pos, move))]
+
+
+def main(repeat=3, tolerance=0.25, update=False, pvs=False):
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    flagged = 0
+    total, elapsed = 0, 0.0
+    for name in DEPTHS:
+        results = [run(name, pvs) for i in range(repeat)]
+        t = min(result[0] for result in results)
+        n, move = results[0][1], results[0][2]
+        total, elapsed = total + n, elapsed + t
+        old = baseline.get(name)
+        status = []
+        if update:
+            baseline[name] = {'depth': DEPTHS[name], 'time': round(t, 4), 'nodes': n,
+                              'nps': round(n / t), 'move': move}
+            status.append('stored')
+        elif old is None or old['depth'] != DEPTHS[name]:
+            status.append('no baseline')
+        else:
+            change = t / old['time'] - 1
+            status.append('%+.0f %%' % (100 * change))
+            if change > tolerance and max(t, old['time']) >= MIN_TIME:
+                status.append('SLOWER')
+                flagged += 1
+            if move != old['move']:
+                status.append('MOVE CHANGED, was %s' % old['move'])
+                flagged += 1
+            if n != old['nodes']:
+                status.append('nodes %+d' % (n - old['nodes']))
+                if n > old['nodes'] * (1 + tolerance):  # the tree grew, whatever the timer says
+                    status.append('MORE NODES')
+                    flagged += 1
+        print('%-9s depth %2d %8.3f s %9d nodes %9.0f nodes/s  %-24s %s'
+              % (name, DEPTHS[name], t, n, n / t, move, ', '.join(status)))
+    print('total %.3f s %d nodes %.0f nodes/s' % (elapsed, total, total / elapsed))
+
+    if update:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+    return flagged
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    repeat = int(args[args.index('--repeat') + 1]) if '--repeat' in args else 3
+    tolerance = float(args[args.index('--tolerance') + 1]) if '--tolerance' in args else 0.25
+    sys.exit(1 if main(repeat, tolerance, '--update' in args, '--pvs' in args) else 0)
@@ -0,0 +1,573 @@
+# 32-square bitboard representation of the checkers board used by the AI engine.
+#
+# Only the dark squares ((y + x) % 2 == 1) are playable, so a position fits in three
+# 32 bit integer masks: black pieces, white pieces and kings (of both colors).
+# Square s lives on row y = s >> 2, four squares per row:
+#
+#   y=0:  .  0  .  1  .  2  .  3
+#   y=1:  4  .  5  .  6  .  7  .
+#   y=2:  .  8  .  9  . 10  . 11
+#   ...
+#
+# 'b' starts on the top rows and moves down (towards higher squares), 'w' moves up.
+#
+# A move is packed in one int: origin square in bits 0-4, destination square in bits 5-9
+# and the captured squares as a mask from bit 10 on. That is all makeMove needs, and the
+# generator keeps one chain per (origin, destination, captured) anyway. packMove and
+# unpackMove convert from and to the paths of squares of the GUI.
+
+import random
+
+N = 8
+
+FULL = 0xFFFFFFFF
+EVEN_ROWS = 0x0F0F0F0F  # y = 0, 2, 4, 6
+ODD_ROWS = 0xF0F0F0F0   # y = 1, 3, 5, 7
+COL0 = 0x11111111       # first square of each row
+COL3 = 0x88888888       # last square of each row
+BLACK_KING_ROW = 0xF0000000  # 'b' is crowned on y = 7
+WHITE_KING_ROW = 0x0000000F  # 'w' is crowned on y = 0
+
+# a diagonal step is a shift of 4 on one row parity and of 3 or 5 on the other,
+# each (mask, shift) pair is one of them, a positive shift moves down the board
+UP_LEFT = ((EVEN_ROWS, -4), (ODD_ROWS & ~COL0, -5))
+UP_RIGHT = ((EVEN_ROWS & ~COL3, -3), (ODD_ROWS, -4))
+DOWN_LEFT = ((EVEN_ROWS, 4), (ODD_ROWS & ~COL0, 3))
+DOWN_RIGHT = ((EVEN_ROWS & ~COL3, 5), (ODD_ROWS, 4))
+
+# quiet steps of the men, and the extra (backward) steps of the kings
+MAN_STEPS = {'b': DOWN_LEFT + DOWN_RIGHT, 'w': UP_LEFT + UP_RIGHT}
+KING_STEPS = {'b': UP_LEFT + UP_RIGHT, 'w': DOWN_LEFT + DOWN_RIGHT}
+
+
+def upLeft(bb):
+    return ((bb & EVEN_ROWS) >> 4) | ((bb & ODD_ROWS & ~COL0) >> 5)
+
+
+def upRight(bb):
+    return ((bb & EVEN_ROWS & ~COL3) >> 3) | ((bb & ODD_ROWS) >> 4)
+
+
+def downLeft(bb):
+    return (((bb & EVEN_ROWS) << 4) | ((bb & ODD_ROWS & ~COL0) << 3)) & FULL
+
+
+def downRight(bb):
+    return (((bb & EVEN_ROWS & ~COL3) << 5) | ((bb & ODD_ROWS) << 4)) & FULL
+
+
+# jump directions of each piece, with the opposite direction used to find the jumpers
+MAN_DIRS = {'b': (downLeft, downRight), 'w': (upLeft, upRight)}
+KING_DIRS = (upLeft, upRight, downLeft, downRight)
+OPPOSITE = {upLeft: downRight, upRight: downLeft, downLeft: upRight, downRight: upLeft}
+
+
+# per square, computed once: the squares one step away and the jumps (jumped bit,
+# landing square, landing bit) in the given directions, off-board ones left out
+def _stepTable(dirs):
+    return [tuple(step(1 << s).bit_length() - 1 for step in dirs if step(1 << s)) for s in range(32)]
+
+
+def _jumpTable(dirs):
+    table = []
+    for s in range(32):
+        jumps = []
+        for step in dirs:
+            m = step(1 << s)
+            e = step(m)
+            if e:
+                jumps.append((m, e.bit_length() - 1, e))
+        table.append(tuple(jumps))
+    return table
+
+
+STEP_TABLE = {'b': _stepTable(MAN_DIRS['b']), 'w': _stepTable(MAN_DIRS['w']), 'k': _stepTable(KING_DIRS)}
+JUMP_TABLE = {'b': _jumpTable(MAN_DIRS['b']), 'w': _jumpTable(MAN_DIRS['w']), 'k': _jumpTable(KING_DIRS)}
+
+
+# Zobrist keys of each piece on each square, and of 'w' to move
+_rng = random.Random(20241017)
+Z_BLACK_MAN = [_rng.getrandbits(64) for s in range(32)]
+Z_BLACK_KING = [_rng.getrandbits(64) for s in range(32)]
+Z_WHITE_MAN = [_rng.getrandbits(64) for s in range(32)]
+Z_WHITE_KING = [_rng.getrandbits(64) for s in range(32)]
+Z_WHITE_TO_MOVE = _rng.getrandbits(64)
+
+
+def zobrist(black, white, kings, color='b'):
+    key = Z_WHITE_TO_MOVE if color == 'w' else 0
+    for s in range(32):
+        bit = 1 << s
+        if black & bit:
+            key ^= Z_BLACK_KING[s] if kings & bit else Z_BLACK_MAN[s]
+        elif white & bit:
+            key ^= Z_WHITE_KING[s] if kings & bit else Z_WHITE_MAN[s]
+    return key
+
+
+class Position:
+    __slots__ = ('black', 'white', 'kings', 'hash', 'blackMen', 'blackKings', 'whiteMen', 'whiteKings')
+
+    # color is the side to move, it only enters the hash
+    def __init__(self, black=0, white=0, kings=0, color='b'):
+        self.black = black
+        self.white = white
+        self.kings = kings
+        self.hash = zobrist(black, white, kings, color)
+        # material, kept up to date by makeMove/unmakeMove
+        self.blackKings = (black & kings).bit_count()
+        self.blackMen = black.bit_count() - self.blackKings
+        self.whiteKings = (white & kings).bit_count()
+        self.whiteMen = white.bit_count() - self.whiteKings
+
+    def copy(self):
+        pos = Position.__new__(Position)
+        pos.black, pos.white, pos.kings, pos.hash = self.black, self.white, self.kings, self.hash
+        pos.blackMen, pos.blackKings = self.blackMen, self.blackKings
+        pos.whiteMen, pos.whiteKings = self.whiteMen, self.whiteKings
+        return pos
+
+    def __eq__(self, other):
+        return (self.black, self.white, self.kings, self.hash) == \
+            (other.black, other.white, other.kings, other.hash)
+
+    def __repr__(self):
+        return '\n'.join(''.join(row) for row in toBoard(self))
+
+
+def op(color):
+    if color in ['b', 'B']:
+        return 'w'
+    if color in ['w', 'W']:
+        return 'b'
+
+
+# square index <-> (y, x) on the 8x8 board
+def toSquare(y, x):
+    return (y << 2) | (x >> 1)
+
+
+def toYX(s):
+    y = s >> 2
+    return y, ((s & 3) << 1) + 1 - (y & 1)
+
+
+def pathToMove(path):
+    return tuple([toSquare(y, x) for (y, x) in path])
+
+
+def moveToPath(move):
+    return [toYX(s) for s in move]
+
+
+# converters to and from the list-of-lists board
+def fromBoard(board, color='b'):
+    black, white, kings = 0, 0, 0
+    for s in range(32):
+        y, x = toYX(s)
+        piece = board[y][x]
+        if piece in ['b', 'B']:
+            black |= 1 << s
+        elif piece in ['w', 'W']:
+            white |= 1 << s
+        if piece in ['B', 'W']:
+            kings |= 1 << s
+    return Position(black, white, kings, color)
+
+
+def toBoard(pos):
+    board = [[' ' for j in range(N)] for i in range(N)]
+    for s in range(32):
+        bit = 1 << s
+        y, x = toYX(s)
+        if pos.black & bit:
+            board[y][x] = 'B' if pos.kings & bit else 'b'
+        elif pos.white & bit:
+            board[y][x] = 'W' if pos.kings & bit else 'w'
+    return board
+
+
+# square of the piece jumped over when going from a to b
+def jumped(a, b):
+    return (a + b + 1 - ((a >> 2) & 1)) >> 1
+
+
+# the packed move of a path of squares
+def packMove(path):
+    captured = 0
+    for i in range(1, len(path)):
+        a, b = path[i - 1], path[i]
+        if abs(b - a) > 5:  # is jump ?
+            captured |= 1 << jumped(a, b)
+    return path[0] | path[-1] << 5 | captured << 10
+
+
+# the path of squares of a move of pos: the landing squares of a chain are found again by
+# jumping over the captured pieces (another order that does it gives the same position)
+def unpackMove(pos, move):
+    s, t, captured = move & 31, move >> 5 & 31, move >> 10
+    if not captured:
+        return (s, t)
+    b = 1 << s
+    jumps = JUMP_TABLE['k' if pos.kings & b else 'b' if pos.black & b else 'w']
+    path = [s]
+
+    def follow(a, left, empty):
+        if not left:
+            return a == t
+        for m, u, e in jumps[a]:
+            if m & left and e & empty:
+                path.append(u)
+                if follow(u, left ^ m, (empty | 1 << a | m) ^ e):
+                    return True
+                del path[-1]
+        return False
+
+    follow(s, captured, ~(pos.black | pos.white) & FULL | b)
+    return tuple(path)
+
+
+# make the (packed) move on the position in place, return the undo record:
+# (from bit, to bit, captured squares, captured kings, promoted ?, old hash)
+def makeMove(pos, move):
+    s, t, captured = move & 31, move >> 5 & 31, move >> 10
+    frm, to = 1 << s, 1 << t
+    kings = pos.kings
+    key = pos.hash
+    if pos.black & frm:
+        ownMan, ownKing, oppMan, oppKing = Z_BLACK_MAN, Z_BLACK_KING, Z_WHITE_MAN, Z_WHITE_KING
+        kingRow = BLACK_KING_ROW
+    else:
+        ownMan, ownKing, oppMan, oppKing = Z_WHITE_MAN, Z_WHITE_KING, Z_BLACK_MAN, Z_BLACK_KING
+        kingRow = WHITE_KING_ROW
+    men, kingsTaken = 0, 0
+    if captured:
+        c = captured
+        while c:
+            b = c & -c
+            c ^= b
+            m = b.bit_length() - 1
+            if kings & b:
+                key ^= oppKing[m]
+                kingsTaken += 1
+            else:
+                key ^= oppMan[m]
+                men += 1
+    capturedKings = captured & kings  # eat a King
+    king = kings & frm
+    promoted = not king and (capturedKings or to & kingRow)
+    if king or promoted:
+        key ^= (ownKing[s] if king else ownMan[s]) ^ ownKing[t]
+        kings = (kings & ~(frm | captured)) | to
+    else:
+        key ^= ownMan[s] ^ ownMan[t]
+        kings &= ~captured
+    if kingRow == BLACK_KING_ROW:
+        pos.black = (pos.black & ~frm) | to
+        pos.white &= ~captured
+        pos.whiteMen -= men
+        pos.whiteKings -= kingsTaken
+        if promoted:
+            pos.blackMen -= 1
+            pos.blackKings += 1
+    else:
+        pos.white = (pos.white & ~frm) | to
+        pos.black &= ~captured
+        pos.blackMen -= men
+        pos.blackKings -= kingsTaken
+        if promoted:
+            pos.whiteMen -= 1
+            pos.whiteKings += 1
+    pos.kings = kings
+    undo = (frm, to, captured, capturedKings, bool(promoted), pos.hash)
+    pos.hash = key ^ Z_WHITE_TO_MOVE
+    return undo
+
+
+# take back the move described by the undo record of makeMove
+def unmakeMove(pos, undo):
+    frm, to, captured, capturedKings, promoted, pos.hash = undo
+    king = pos.kings & to and not promoted
+    if captured:
+        kingsTaken = capturedKings.bit_count()
+        men = captured.bit_count() - kingsTaken
+    else:
+        men, kingsTaken = 0, 0
+    if pos.black & to:
+        pos.black = (pos.black & ~to) | frm
+        pos.white |= captured
+        pos.whiteMen += men
+        pos.whiteKings += kingsTaken
+        if promoted:
+            pos.blackMen += 1
+            pos.blackKings -= 1
+    else:
+        pos.white = (pos.white & ~to) | frm
+        pos.black |= captured
+        pos.blackMen += men
+        pos.blackKings += kingsTaken
+        if promoted:
+            pos.whiteMen += 1
+            pos.whiteKings -= 1
+    pos.kings = (pos.kings & ~to) | capturedKings
+    if king:
+        pos.kings |= frm
+
+
+# the winner if one side has no pieces left; the callers report it, this runs inside the search
+def gameOver(pos):
+    if pos.blackMen + pos.blackKings == 0:
+        return 'w'  # w win
+    if pos.whiteMen + pos.whiteKings == 0:
+        return 'b'  # b win
+    return None
+
+
+DRAW_PLIES = 80  # plies without a capture or a man move that make a draw (40 moves each)
+REPETITIONS = 3  # a position that comes back this many times is a draw
+
+
+# The positions of a game since the last capture or man move (nothing before them can
+# come back), for the draw rules. The search takes them too, see AI.Engine.search.
+class GameHistory:
+    def __init__(self, pos, drawPlies=DRAW_PLIES, repetitions=REPETITIONS):
+        self.drawPlies = drawPlies
+        self.repetitions = repetitions
+        self.hashes = [pos.hash]  # the current position last
+        self.men = (pos.black | pos.white) & ~pos.kings
+        self.pieces = (pos.black | pos.white).bit_count()
+
+    # add the position after a move
+    def push(self, pos):
+        men = (pos.black | pos.white) & ~pos.kings
+        pieces = (pos.black | pos.white).bit_count()
+        if men != self.men or pieces != self.pieces:  # a man moved or a piece was taken
+            self.hashes = []
+            self.men, self.pieces = men, pieces
+        self.hashes.append(pos.hash)
+
+    # plies since the last capture or man move
+    def quietPlies(self):
+        return len(self.hashes) - 1
+
+    # 'repetition', 'rule' (DRAW_PLIES) or None
+    def draw(self):
+        if self.hashes.count(self.hashes[-1]) >= self.repetitions:
+            return 'repetition'
+        if self.quietPlies() >= self.drawPlies:
+            return 'rule'
+        return None
+
+
+# use dfs to get the complete jump chains of the piece on square s, jumps is its JUMP_TABLE:
+# a chain only ends where no jump is left, or where a man eats a King. move holds the
+# origin and the pieces captured so far; chains with the same destination and captured
+# pieces (a King taking them in another order) are the same move, seen keeps the first
+def dfs(s, king, jumps, opp, oppKings, empty, move, moves, seen):
+    ended = True
+    for m, t, e in jumps[s]:  # try the directions from s
+        if m & opp and e & empty:
+            # jump from s, by m, to t
+            ended = False
+            if not king and m & oppKings:  # eat the King, the jump ends here
+                done = move | t << 5 | m << 10
+                if done not in seen:
+                    seen.add(done)
+                    moves.append(done)
+            else:
+                dfs(t, king, jumps, opp ^ m, oppKings, (empty | 1 << s | m) ^ e, move | m << 10, moves, seen)
+
+    if ended and move >> 10:
+        done = move | s << 5
+        if done not in seen:
+            seen.add(done)
+            moves.append(done)
+
+
+# the pieces of color with at least one jump: step back twice from the empty squares
+def getJumpers(pos, color='b'):
+    if color == 'b':
+        own, opp = pos.black, pos.white
+    else:
+        own, opp = pos.white, pos.black
+    empty = ~(pos.black | pos.white) & FULL
+    kings = own & pos.kings
+
+    jumpers = 0
+    for step in MAN_DIRS[color]:
+        back = OPPOSITE[step]
+        jumpers |= back(back(empty) & opp) & own
+    if kings:
+        for step in MAN_DIRS[op(color)]:
+            back = OPPOSITE[step]
+            jumpers |= back(back(empty) & opp) & kings
+    return jumpers
+
+
+def getJumpPaths(pos, color='b'):
+    jumpers = getJumpers(pos, color)
+    paths = []
+    if not jumpers:
+        return paths
+
+    if color == 'b':
+        own, opp = pos.black, pos.white
+    else:
+        own, opp = pos.white, pos.black
+    empty = ~(pos.black | pos.white) & FULL
+    kings = own & pos.kings
+    oppKings = opp & pos.kings
+    while jumpers:
+        b = jumpers & -jumpers
+        jumpers ^= b
+        s = b.bit_length() - 1
+        king = kings & b
+        jumps = JUMP_TABLE['k'] if king else JUMP_TABLE[color]
+        dfs(s, king, jumps, opp, oppKings, empty | b, s, paths, set())
+    return paths
+
+
+def getMovePaths(pos, color='b'):
+    if color == 'b':
+        own = pos.black
+    else:
+        own = pos.white
+    empty = ~(pos.black | pos.white) & FULL
+    kings = own & pos.kings
+
+    paths = []
+    for steps, movers in ((MAN_STEPS[color], own), (KING_STEPS[color], kings)):
+        if not movers:
+            continue
+        for mask, n in steps:
+            src = movers & mask
+            dst = (src << n if n > 0 else src >> -n) & empty
+            while dst:
+                b = dst & -dst
+                dst ^= b
+                t = b.bit_length() - 1
+                paths.append(t - n | t << 5)
+    return paths
+
+
+# the quiet moves of the men of color onto the king row, in the order of getMovePaths
+def getPromotionPaths(pos, color='b'):
+    if color == 'b':
+        own, kingRow = pos.black, BLACK_KING_ROW
+    else:
+        own, kingRow = pos.white, WHITE_KING_ROW
+    empty = ~(pos.black | pos.white) & kingRow
+    men = own & ~pos.kings
+
+    paths = []
+    for mask, n in MAN_STEPS[color]:
+        src = men & mask
+        dst = (src << n if n > 0 else src >> -n) & empty
+        while dst:
+            b = dst & -dst
+            dst ^= b
+            t = b.bit_length() - 1
+            paths.append(t - n | t << 5)
+    return paths
+
+
+# reasons of validateMove for rejecting a move
+MOVE_OK = 0
+TOO_SHORT = 1  # less than two squares
+NO_PIECE = 2  # no piece of the side to move on the first square
+NOT_DIAGONAL = 3  # a step that is neither a diagonal step nor a jump (or a step after a jump)
+BACKWARD = 4  # a man moving or jumping backwards
+OCCUPIED = 5  # landing on a piece
+NOTHING_JUMPED = 6  # jumping over an empty square or an own piece
+MUST_CAPTURE = 7  # a step while a capture is possible
+CHAIN_ENDED = 8  # jumping on after a man took a king
+OFF_BOARD = 9  # not a playable square (only checked on (y, x) paths, see AI.checkMove)
+MUST_CONTINUE = 10  # a chain of jumps that stops while the piece can still jump
+
+MOVE_REASONS = {MOVE_OK: 'valid move', TOO_SHORT: 'the move needs at least two squares',
+                NO_PIECE: 'no piece of yours on the first square', NOT_DIAGONAL: 'not a diagonal step or jump',
+                BACKWARD: 'a man can not move backwards', OCCUPIED: 'the square is occupied',
+                NOTHING_JUMPED: 'no opponent piece to jump over', MUST_CAPTURE: 'a capture is possible, it is forced',
+                CHAIN_ENDED: 'a man that takes a king stops there', OFF_BOARD: 'not a playable square',
+                MUST_CONTINUE: 'the capture goes on while a jump is possible'}
+
+
+# check the move (a path of squares) of color against the rules, without generating the
+# other moves: return MOVE_OK or the reason why it is not allowed
+def validateMove(pos, move, color):
+    if len(move) < 2:
+        return TOO_SHORT
+    if color == 'b':
+        own, opp = pos.black, pos.white
+    else:
+        own, opp = pos.white, pos.black
+    s, t = move[0], move[1]
+    b = 1 << s
+    if not own & b:
+        return NO_PIECE
+    king = pos.kings & b
+    piece = 'k' if king else color
+
+    if len(move) == 2 and t in STEP_TABLE['k'][s]:  # a quiet step
+        if t not in STEP_TABLE[piece][s]:
+            return BACKWARD
+        if (pos.black | pos.white) >> t & 1:
+            return OCCUPIED
+        if getJumpers(pos, color):
+            return MUST_CAPTURE
+        return MOVE_OK
+
+    # a jump or a chain of jumps, captured pieces are taken off at once like in dfs
+    empty = ~(pos.black | pos.white) & FULL | b
+    oppKings = opp & pos.kings
+    ended = False
+    for i in range(1, len(move)):
+        a, t = move[i - 1], move[i]
+        for jump in JUMP_TABLE['k'][a]:
+            if jump[1] == t:
+                break
+        else:
+            return NOT_DIAGONAL
+        m, t, e = jump
+        if ended:
+            return CHAIN_ENDED
+        if jump not in JUMP_TABLE[piece][a]:
+            return BACKWARD
+        if not e & empty:
+            return OCCUPIED
+        if not m & opp:
+            return NOTHING_JUMPED
+        if not king and m & oppKings:  # eat the King, the jump ends here
+            ended = True
+        opp ^= m
+        empty = (empty | 1 << a | m) ^ e
+    if not ended:
+        for m, t, e in JUMP_TABLE[piece][move[-1]]:
+            if m & opp and e & empty:
+                return MUST_CONTINUE
+    return MOVE_OK
+
+
+# the legal (packed) moves of color as a set, to check moves by hashing; cached per position
+_legalSets = {}
+
+
+def legalMoveSet(pos, color):
+    key = (pos.hash, pos.black, pos.white, pos.kings, color)
+    moves = _legalSets.get(key)
+    if moves is None:
+        if len(_legalSets) >= 4096:
+            _legalSets.clear()
+        moves = _legalSets[key] = frozenset(getAllMoves(pos, color))
+    return moves
+
+
+# get all the valid moves (packed): first jump. if no jump, then move
+def getAllMoves(pos, color='b'):
+    # first get all the Jump
+    paths = getJumpPaths(pos, color)
+    if paths:
+        return paths
+
+    # if no Jump, get the Move
+    return getMovePaths(pos, color)
@@ -0,0 +1,101 @@
+# Opening book: every position reachable from initBoard() in the first plies, searched
+# deeply offline, with its best move(s) written to a file sorted by Zobrist hash and
+# read through mmap by callMinimax.
+#
+#   python book.py [plies] [depth] [file]
+#
+# File: header (magic, version, number of records), then records of
+# (position hash, packed move (see bitboard.py), score), sorted by hash. A position with
+# several equally good moves has one record per move.
+
+import mmap
+import struct
+import sys
+import time
+from bitboard import op, fromBoard, makeMove
+from transposition import TranspositionTable
+
+MAGIC = b'BMOB'
+VERSION = 2  # 1 packed the whole path of squares
+HEADER = struct.Struct('<4sHI')
+RECORD = struct.Struct('<QQi')
+
+DEFAULT_PLIES = 4
+DEFAULT_DEPTH = 8
+DEFAULT_FILE = 'opening.book'
+
+
+def build(plies=DEFAULT_PLIES, depth=DEFAULT_DEPTH, path=DEFAULT_FILE):
+    import AI  # AI imports this module to read the book
+
+    engine = AI.Engine(TranspositionTable(64))
+    records = []
+    seen = set()
+    frontier = [(fromBoard(AI.initBoard(), 'b'), 'b')]
+    for ply in range(plies):
+        start = time.time()
+        following = []
+        for pos, color in frontier:
+            if pos.hash in seen:
+                continue
+            seen.add(pos.hash)
+            scores = engine.scoreMoves(pos, color, depth)
+            if not scores:
+                continue
+            best = max(score for score, move in scores)
+            for score, move in scores:
+                if score == best:
+                    records.append((pos.hash, move, score))
+                child = pos.copy()
+                makeMove(child, move)
+                following.append((child, op(color)))
+        print('ply', ply, len(frontier), 'positions', round(time.time() - start, 1), 's')
+        frontier = following
+
+    records.sort()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+
+
+# read-only view of a book file, searched in place through mmap
+class Book:
+    def __init__(self, path=DEFAULT_FILE):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not an opening book file: ' + path)
+
+    def key(self, i):
+        return RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)[0]
+
+    # the best moves of the position (the hash includes the side to move), [] if unknown
+    def probe(self, pos):
+        lo, hi = 0, self.count
+        while lo < hi:  # first record with the hash
+            mid = (lo + hi) >> 1
+            if self.key(mid) < pos.hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        moves = []
+        while lo < self.count:
+            key, move, score = RECORD.unpack_from(self.data, HEADER.size + lo * RECORD.size)
+            if key != pos.hash:
+                break
+            moves.append(move)
+            lo += 1
+        return moves
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    build(int(args[0]) if len(args) > 0 else DEFAULT_PLIES,
+          int(args[1]) if len(args) > 1 else DEFAULT_DEPTH,
+          args[2] if len(args) > 2 else DEFAULT_FILE)
@@ -0,0 +1,123 @@
+# Evaluation of positions: weighted material plus piece-square tables, for one position
+# (evaluate) or for a whole batch at once with NumPy (evaluateBatch).
+#
+#   python evaluate.py positions.npy   score a saved batch, in chunks
+#   python evaluate.py --random n      measure the speed on n random positions
+#
+# A batch is an (N, 32) int8 array, one row per position and one column per square:
+# 0 empty, 1 'b' man, 2 'b' king, -1 'w' man, -2 'w' king (see encode). Scores are
+# from the point of view of 'b' and are the same as evaluate gives for each position.
+
+import sys
+import time
+import numpy as np
+
+MAN = 100
+KING = 1000
+
+# bonus of a 'b' man per row: guarding the back row, then getting closer to the crown
+MAN_ROWS = [6, 0, 1, 2, 4, 7, 10, 0]
+# bonus of a king per row and per column, it is stronger in the center
+KING_ROWS = [0, 2, 4, 6, 6, 4, 2, 0]
+KING_COLS = [0, 2, 4, 6, 6, 4, 2, 0]
+
+
+def _squareScores():
+    man, king = [], []
+    for s in range(32):
+        y = s >> 2
+        x = 2 * (s & 3) + 1 - (y & 1)
+        man.append(MAN + MAN_ROWS[y])
+        king.append(KING + KING_ROWS[y] + KING_COLS[x])
+    # 'w' is 'b' turned around: square s seen from the other side is 31 - s
+    return np.array([[-king[31 - s] for s in range(32)],
+                     [-man[31 - s] for s in range(32)],
+                     [0] * 32,
+                     man,
+                     king], dtype=np.int32)
+
+
+# score of each piece (code + 2) on each square
+SQUARE_SCORES = _squareScores()
+_FLAT = SQUARE_SCORES.ravel()
+_OFFSETS = np.arange(32, dtype=np.int16)
+
+
+# for each byte of a mask, the sum of the scores of its squares: 4 * 256 entries
+def _byteTable(scores):
+    table = [0] * 1024
+    for k in range(4):
+        for b in range(1, 256):
+            low = b & -b
+            table[k << 8 | b] = table[k << 8 | b ^ low] + int(scores[8 * k + low.bit_length() - 1])
+    return table
+
+
+_WHITE_KING, _WHITE_MAN, _, _BLACK_MAN, _BLACK_KING = [_byteTable(row) for row in SQUARE_SCORES]
+
+
+# score of one bitboard.Position for color
+def evaluate(pos, color):
+    kings = pos.kings
+    bm, bk = pos.black & ~kings, pos.black & kings
+    wm, wk = pos.white & ~kings, pos.white & kings
+    score = _BLACK_MAN[bm & 255] + _BLACK_MAN[256 | bm >> 8 & 255] + \
+        _BLACK_MAN[512 | bm >> 16 & 255] + _BLACK_MAN[768 | bm >> 24] + \
+        _WHITE_MAN[wm & 255] + _WHITE_MAN[256 | wm >> 8 & 255] + \
+        _WHITE_MAN[512 | wm >> 16 & 255] + _WHITE_MAN[768 | wm >> 24]
+    if kings:
+        score += _BLACK_KING[bk & 255] + _BLACK_KING[256 | bk >> 8 & 255] + \
+            _BLACK_KING[512 | bk >> 16 & 255] + _BLACK_KING[768 | bk >> 24] + \
+            _WHITE_KING[wk & 255] + _WHITE_KING[256 | wk >> 8 & 255] + \
+            _WHITE_KING[512 | wk >> 16 & 255] + _WHITE_KING[768 | wk >> 24]
+    return score if color == 'b' else -score
+
+
+# (N, 32) int8 batch of the positions given by their masks (sequences of N ints)
+def encode(black, white, kings):
+    shifts = np.arange(32, dtype=np.uint32)
+    b = (np.asarray(black, dtype=np.uint32)[:, None] >> shifts & 1).astype(np.int8)
+    w = (np.asarray(white, dtype=np.uint32)[:, None] >> shifts & 1).astype(np.int8)
+    k = (np.asarray(kings, dtype=np.uint32)[:, None] >> shifts & 1).astype(np.int8)
+    return (b - w) * (1 + k)
+
+
+# N scores of an (N, 32) batch, for color
+def evaluateBatch(boards, color='b'):
+    scores = _FLAT.take((boards.astype(np.int16) + 2) * 32 + _OFFSETS).sum(axis=1)
+    return scores if color == 'b' else -scores
+
+
+# (N, 160) 0/1 matrix of which piece stands on which square, the scores are
+# features(boards) @ SQUARE_SCORES.ravel(): fit it to tune the tables
+def features(boards):
+    onehot = np.zeros((len(boards), 5, 32), dtype=np.int8)
+    np.put_along_axis(onehot, (boards.astype(np.intp) + 2)[:, None, :], 1, axis=1)
+    return onehot.reshape(len(boards), 160)
+
+
+# random positions with 1 to 12 pieces per side, for measurements
+def randomBatch(n, seed=0):
+    rng = np.random.default_rng(seed)
+    boards = rng.choice(np.array([-2, -1, -1, -1, 0, 0, 0, 1, 1, 1, 2], dtype=np.int8), size=(n, 32))
+    boards[:, 28:][boards[:, 28:] == 1] = 2  # no man on its own crowning row
+    boards[:, :4][boards[:, :4] == -1] = -2
+    return boards
+
+
+def main(args):
+    if args[0] == '--random':
+        boards = randomBatch(int(args[1]))
+    else:
+        boards = np.load(args[0], mmap_mode='r')
+    chunk = 1 << 20
+    start = time.perf_counter()
+    scores = np.concatenate([evaluateBatch(np.asarray(boards[i:i + chunk]))
+                             for i in range(0, len(boards), chunk)])
+    t = time.perf_counter() - start
+    print('%d positions %.3f s %.0f positions/s' % (len(scores), t, len(scores) / t))
+    print('score mean %.1f std %.1f min %d max %d' % (scores.mean(), scores.std(), scores.min(), scores.max()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -3,6 +3,7 @@ import numpy as np
 import random
 from find_dots import find_dots
 from AI import AI
+from bitboard import REPETITIONS
 
 class Piece:
     def __init__(self, x, y, piece_type):
@@ -72,6 +73,8 @@ class Game:
         self.opponent_legal_moves = []
         self.previous_board = []
         self.new_board = []
+        self.positions = {}  # (board, side to move) -> times seen since the last capture
+        self.pieces = None  # pieces on the board at the last check_draw
 
     def add_piece(self, piece):
         self.board.place_piece(piece)
@@ -133,6 +136,21 @@ class Game:
             print("No move detected.")
             return None, None
 
+    def check_draw(self, turn):
+        """Count the current position, return the reason of a draw or None"""
+        # no kings on this board: every move is a man move, so the no-progress rule of
+        # bitboard.DRAW_PLIES never applies and only repetitions make a draw
+        board = tuple(tuple(row) for row in self.board.board)
+        pieces = sum(cell is not None for row in board for cell in row)
+        if self.pieces is not None and pieces != self.pieces:  # a capture, nothing before comes back
+            self.positions.clear()
+        self.pieces = pieces
+        key = (board, turn % 2)
+        self.positions[key] = self.positions.get(key, 0) + 1
+        if self.positions[key] >= REPETITIONS:
+            return "the same position came back %d times" % REPETITIONS
+        return None
+
     def play_game(self):
         turn = 0
         game.find_player_pieces("2245")
@@ -159,6 +177,11 @@ class Game:
                 print("No more legal moves available. Game over!")
                 break
 
+            draw = self.check_draw(turn)
+            if draw:
+                print("Draw: " + draw + ". Game over!")
+                break
+
             if turn % 2 == 0:  # Player's turn
                 imgnr = input("Img: ")
 
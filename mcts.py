@@ -0,0 +1,205 @@
+# Monte Carlo tree search engine, the alternative to the minimax of AI.py: UCT selection,
+# random or light playouts over the bitboard rules, an iteration or time budget, and the
+# tree kept from one turn to the next. With parallel the playouts run on the worker pool
+# of AI.py, the leaves waiting for a result carry a virtual loss so that the next
+# selections spread over other lines.
+#
+# Results are in [0, 1] from the point of view of 'b': 1 'b' wins, 0 'w' wins.
+
+import math
+import random
+import time
+import AI
+from bitboard import (Position, op, fromBoard, moveToPath, unpackMove, makeMove, unmakeMove, gameOver,
+                      getAllMoves, getJumpers, BLACK_KING_ROW, WHITE_KING_ROW)
+from evaluate import evaluate
+
+UCT_C = 1.2  # exploration constant
+PLAYOUT_PLIES = 80  # a playout longer than this is scored by the evaluation
+DRAW_MARGIN = 150  # evaluation below which an unfinished playout is a draw
+VIRTUAL_LOSS = 1
+BATCH_PER_WORKER = 8  # playouts sent to a worker at a time
+
+
+class Node:
+    __slots__ = ('move', 'parent', 'children', 'untried', 'color', 'hash', 'visits', 'wins', 'winner')
+
+    # color is the side to move at the node, wins are counted for the side that moved into it
+    def __init__(self, pos, color, move=None, parent=None, rng=None):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.color = color
+        self.hash = pos.hash
+        self.visits = 0
+        self.wins = 0.0
+        self.winner = gameOver(pos)  # known result of a finished game
+        self.untried = [] if self.winner is not None else getAllMoves(pos, color)
+        if self.winner is None and not self.untried:
+            self.winner = op(color)  # no move left
+        if rng is not None:
+            rng.shuffle(self.untried)
+
+    def select(self):
+        log = math.log(self.visits)
+        return max(self.children, key=lambda child: child.wins / child.visits +
+                   UCT_C * math.sqrt(log / child.visits))
+
+
+# play random moves from the position: captures are forced anyway, with light the
+# longest capture, a promotion or a move that does not give a piece away is preferred
+def playout(black, white, kings, color, seed, light=True):
+    rng = random.Random(seed)
+    pos = Position(black, white, kings, color)
+    for ply in range(PLAYOUT_PLIES):
+        moves = getAllMoves(pos, color)
+        if not moves:
+            return 0.0 if color == 'b' else 1.0
+        move = None
+        if light:
+            if moves[0] >> 10:  # captures
+                longest = max((m >> 10).bit_count() for m in moves)
+                move = rng.choice([m for m in moves if (m >> 10).bit_count() == longest])
+            else:
+                kingRow = BLACK_KING_ROW if color == 'b' else WHITE_KING_ROW
+                men = ~pos.kings
+                promotions = [m for m in moves if men >> (m & 31) & kingRow >> (m >> 5) & 1]
+                if promotions:
+                    move = rng.choice(promotions)
+                else:
+                    for i in range(3):  # a few tries at a move that leaves no capture
+                        m = rng.choice(moves)
+                        undo = makeMove(pos, m)
+                        safe = not getJumpers(pos, op(color))
+                        unmakeMove(pos, undo)
+                        if safe:
+                            move = m
+                            break
+        makeMove(pos, move if move is not None else rng.choice(moves))
+        if gameOver(pos) is not None:
+            return 1.0 if color == 'b' else 0.0
+        color = op(color)
+    score = evaluate(pos, 'b')
+    if abs(score) < DRAW_MARGIN:
+        return 0.5
+    return 1.0 if score > 0 else 0.0
+
+
+# run in a worker: the playouts of a list of (black, white, kings, color, seed)
+def playouts(jobs, light=True):
+    return [playout(black, white, kings, color, seed, light) for black, white, kings, color, seed in jobs]
+
+
+class MCTS:
+    def __init__(self, seed=None, light=True):
+        self.rng = random.Random(seed)
+        self.light = light
+        self.root = None
+        self.iterations = 0  # of the last search
+        self.reused = 0  # visits kept from the previous search
+
+    # keep the subtree of pos if it was searched before (up to two plies down), else a new root
+    def setRoot(self, pos, color):
+        if self.root is not None:
+            for node in [self.root] + self.root.children + [g for c in self.root.children for g in c.children]:
+                if node.hash == pos.hash and node.color == color:
+                    node.parent = None
+                    self.root = node
+                    self.reused = node.visits
+                    return
+        self.root = Node(pos, color, rng=self.rng)
+        self.reused = 0
+
+    # walk down from the root to a new leaf, making its moves on pos; with virtual loss
+    # the nodes of the path count a lost visit until backup
+    def descend(self, pos, virtual):
+        node = self.root
+        while not node.untried and node.children:
+            node = node.select()
+            makeMove(pos, node.move)
+        if node.untried:
+            move = node.untried.pop()
+            makeMove(pos, move)
+            child = Node(pos, op(node.color), move, node, self.rng)
+            node.children.append(child)
+            node = child
+        if virtual:
+            n = node
+            while n is not None:
+                n.visits += VIRTUAL_LOSS
+                n = n.parent
+        return node
+
+    def backup(self, node, result, virtual):
+        while node is not None:
+            if virtual:
+                node.visits -= VIRTUAL_LOSS
+            node.visits += 1
+            node.wins += result if node.color == 'w' else 1.0 - result  # for the side that moved here
+            node = node.parent
+
+    @staticmethod
+    def known(node):
+        if node.winner is None:
+            return None
+        return 1.0 if node.winner == 'b' else 0.0
+
+    # best move (packed, None if there is no move) for color; stop after iterations
+    # playouts or time_ms, whichever comes first, but always play at least one
+    def search(self, pos, color, iterations=None, time_ms=None, parallel=False):
+        if iterations is None and time_ms is None:
+            iterations = 1000
+        if iterations is not None:
+            iterations = max(1, iterations)
+        deadline = time.time() + time_ms / 1000.0 if time_ms is not None else None
+        self.setRoot(pos, color)
+        root = self.root
+        if root.winner is not None and not root.children:
+            return None
+        if parallel:
+            AI.startPool()
+            workers = AI.POOL_WORKERS
+            batch = BATCH_PER_WORKER * workers
+        done = 0
+        while done == 0 or (iterations is None or done < iterations) and (deadline is None or time.time() < deadline):
+            if not parallel:
+                child = pos.copy()
+                node = self.descend(child, False)
+                result = self.known(node)
+                if result is None:
+                    result = playout(child.black, child.white, child.kings, node.color,
+                                     self.rng.getrandbits(32), self.light)
+                self.backup(node, result, False)
+                done += 1
+                continue
+
+            # select a batch of leaves, then play them out on the pool, one job per worker
+            leaves, jobs = [], []
+            for i in range(batch if iterations is None else min(batch, iterations - done)):
+                child = pos.copy()
+                node = self.descend(child, True)
+                result = self.known(node)
+                if result is not None:
+                    self.backup(node, result, True)
+                else:
+                    leaves.append(node)
+                    jobs.append((child.black, child.white, child.kings, node.color, self.rng.getrandbits(32)))
+                done += 1
+            futures = [AI.POOL.submit(playouts, jobs[w::workers], self.light) for w in range(workers)]
+            for w, future in enumerate(futures):
+                for node, result in zip(leaves[w::workers], future.result()):
+                    self.backup(node, result, True)
+        self.iterations = done
+        best = max(root.children, key=lambda child: child.visits)
+        return best.move
+
+
+# tree is an MCTS to reuse across turns (a new one is used if None), see MCTS.search
+def callMCTS(board, color, iterations=None, time_ms=None, tree=None, parallel=False):
+    tree = tree if tree is not None else MCTS()
+    pos = fromBoard(board, color)
+    move = tree.search(pos, color, iterations, time_ms, parallel)
+    path = moveToPath(unpackMove(pos, move)) if move is not None else []
+    if path:
+        print('MCTS: ', path, 'playouts', tree.iterations, 'reused', tree.reused)
+    return path
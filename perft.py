@@ -0,0 +1,313 @@
+# Perft: count the leaf nodes of the move tree to a fixed depth, to check the move
+# generator against the reference counts in perft.json and to measure its speed.
+#
+#   python perft.py [max_depth] [--update]
+#   python perft.py --validate [positions] [--seed s]
+#
+# --update rewrites the reference counts, only do it after checking that a change in
+# the counts is intended (a rule change, not a move generator bug).
+# --validate checks on random positions what the counts do not cover, see validate (it
+# builds a 3-piece tablebase, about half a minute).
+
+import json
+import os
+import random
+import sys
+import time
+from bitboard import (N, STEP_TABLE, JUMP_TABLE, MOVE_OK, Position, op, fromBoard, packMove, unpackMove,
+                      makeMove, unmakeMove, getAllMoves, validateMove)
+
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft.json')
+
+# name -> (rows, side to move); the rows use the layout of initBoard
+POSITIONS = {
+    'start': ([".b.b.b.b",
+               "b.b.b.b.",
+               ".b.b.b.b",
+               "........",
+               "........",
+               "w.w.w.w.",
+               ".w.w.w.w",
+               "w.w.w.w."], 'b'),
+    'midgame': ([".b.b.b.b",
+                 "b.b...b.",
+                 ".b...b.b",
+                 "..b.....",
+                 ".w.b.w..",
+                 "w.....w.",
+                 ".w.w.w.w",
+                 "w.w...w."], 'w'),
+    'kings': (["...b...b",
+               "........",
+               "...b.b..",
+               "..b.w...",
+               ".......b",
+               "w...B.w.",
+               "........",
+               "B.....B."], 'b'),
+    'regicide': ([".......b",
+                  "..b.....",
+                  "...W....",
+                  "..w.....",
+                  ".....w..",
+                  "..w.w...",
+                  ".W......",
+                  "........"], 'b'),
+    'endgame': ([".W......",
+                 "........",
+                 ".W......",
+                 "........",
+                 ".....w..",
+                 "........",
+                 "........",
+                 "B......."], 'b'),
+}
+
+DEPTHS = {'start': 8, 'midgame': 9, 'kings': 10, 'regicide': 9, 'endgame': 8}
+
+
+def toBoard(rows):
+    board = [[' ' for j in range(N)] for i in range(N)]
+    for y in range(N):
+        for x in range(N):
+            if rows[y][x] != '.':
+                board[y][x] = rows[y][x]
+    return board
+
+
+def perft(pos, color, depth):
+    moves = getAllMoves(pos, color)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = makeMove(pos, move)
+        nodes += perft(pos, op(color), depth - 1)
+        unmakeMove(pos, undo)
+    return nodes
+
+
+def main(maxDepth=None, update=False):
+    reference = {}
+    if os.path.exists(REFERENCE_FILE):
+        with open(REFERENCE_FILE) as f:
+            reference = json.load(f)
+
+    failed = 0
+    total, elapsed = 0, 0.0
+    for name, (rows, color) in POSITIONS.items():
+        pos = fromBoard(toBoard(rows), color)
+        counts = reference.setdefault(name, {})
+        for depth in range(1, min(DEPTHS[name], maxDepth or DEPTHS[name]) + 1):
+            start = time.perf_counter()
+            nodes = perft(pos, color, depth)
+            t = time.perf_counter() - start
+            total, elapsed = total + nodes, elapsed + t
+            expected = counts.get(str(depth))
+            if update:
+                counts[str(depth)] = nodes
+                status = 'stored'
+            elif expected is None:
+                status = 'no reference'
+            elif expected == nodes:
+                status = 'ok'
+            else:
+                status = 'MISMATCH, expected %d' % expected
+                failed += 1
+            print('%-9s depth %d %10d nodes %8.3f s %9.0f nodes/s  %s'
+                  % (name, depth, nodes, t, nodes / t if t else 0, status))
+    print('total %d nodes %.3f s %.0f nodes/s' % (total, elapsed, total / elapsed if elapsed else 0))
+
+    if update:
+        with open(REFERENCE_FILE, 'w') as f:
+            json.dump(reference, f, indent=1, sort_keys=True)
+    return failed
+
+
+# a random position with up to pieces pieces, a fraction kingRate of them kings
+def randomPosition(rng, pieces=20, kingRate=0.3):
+    squares = rng.sample(range(32), rng.randrange(2, pieces + 1))
+    black, white, kings = 0, 0, 0
+    for s in squares:
+        if rng.random() < 0.5:
+            black |= 1 << s
+        else:
+            white |= 1 << s
+        if rng.random() < kingRate:
+            kings |= 1 << s
+    kings |= black & 0xF0000000 | white & 0x0000000F  # no man on its king row
+    return Position(black, white, kings)
+
+
+def result(pos, move):
+    child = pos.copy()
+    makeMove(child, move)
+    return child.black, child.white, child.kings
+
+
+# validateMove against the generator: on candidate paths (the generated moves, every step
+# and jump, random chains of jumps) it accepts every generated path and nothing that does
+# not play like a generated move (a chain taken in another order is fine)
+def checkValidateMove(rng, count):
+    checked, failed = 0, 0
+    for i in range(count):
+        pos = randomPosition(rng)
+        for color in 'bw':
+            moves = getAllMoves(pos, color)
+            legal = {result(pos, move) for move in moves}
+            generated = {unpackMove(pos, move) for move in moves}
+            paths = set(generated)
+            for s in range(32):
+                paths.update((s, t) for t in STEP_TABLE['k'][s])
+                paths.update((s, t) for m, t, e in JUMP_TABLE['k'][s])
+            for j in range(20):
+                path = [rng.randrange(32)]
+                for k in range(rng.randrange(1, 4)):
+                    path.append(rng.choice(JUMP_TABLE['k'][path[-1]])[1])
+                paths.add(tuple(path))
+            for path in paths:
+                checked += 1
+                ok = validateMove(pos, path, color) == MOVE_OK
+                if ok != (path in generated) and (not ok or result(pos, packMove(path)) not in legal):
+                    failed += 1
+                    if failed <= 5:
+                        print('validateMove disagrees on', path, color, 'in\n%r' % pos)
+    print('validateMove  %8d paths  %s' % (checked, 'ok' if not failed else '%d FAILED' % failed))
+    return failed
+
+
+# packed moves: each generated move comes back from its path, no move is generated twice
+# and no two moves lead to the same position
+def checkPackedMoves(rng, count):
+    checked, failed = 0, 0
+    for i in range(count):
+        pos = randomPosition(rng)
+        for color in 'bw':
+            moves = getAllMoves(pos, color)
+            checked += len(moves)
+            bad = [move for move in moves if packMove(unpackMove(pos, move)) != move]
+            if len(set(moves)) != len(moves) or len({result(pos, move) for move in moves}) != len(moves):
+                bad.append('duplicates')
+            if bad:
+                failed += 1
+                if failed <= 5:
+                    print('packed moves wrong:', bad[:3], color, 'in\n%r' % pos)
+    print('packMove      %8d moves  %s' % (checked, 'ok' if not failed else '%d FAILED' % failed))
+    return failed
+
+
+# tablebase: build a small one and check sampled values against one ply of search over it
+# (a loss when no move is left, else the best of the children, one ply further)
+def checkTablebase(rng, count, pieces=3):
+    import contextlib
+    import tempfile
+    import tablebase
+    checked, failed = 0, 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'check.tb')
+        with contextlib.redirect_stdout(None):
+            tablebase.build(pieces, path)
+        tb = tablebase.Tablebase(path)
+        for sig, (size, offset) in tb.slices.items():
+            for i in rng.sample(range(size), min(count, size)):
+                pos = tablebase.position(i, sig)
+                if pos is None:
+                    continue
+                for color in 'bw':
+                    values = []
+                    for move in getAllMoves(pos, color):
+                        undo = makeMove(pos, move)
+                        values.append(-1 if not pos.black or not pos.white else tb.probe(pos, op(color)))
+                        unmakeMove(pos, undo)
+                    losses = [-v - 1 for v in values if v < 0]
+                    if not values:
+                        expected = -1
+                    elif losses:
+                        expected = min(losses) + 1
+                    elif all(v > 0 for v in values):
+                        expected = -max(values) - 2
+                    else:
+                        expected = 0
+                    checked += 1
+                    if tb.probe(pos, color) != expected:
+                        failed += 1
+                        if failed <= 5:
+                            print('tablebase value', tb.probe(pos, color), 'expected', expected, color,
+                                  'in\n%r' % pos)
+        tb.close()
+    print('tablebase     %8d values %s' % (checked, 'ok' if not failed else '%d FAILED' % failed))
+    return failed
+
+
+# AI.BATCH_EVAL: the search gives the same score to every root move with the last ply
+# scored in one batch as with the plain move loop (no table, its bounds depend on the
+# move order). King endings with even material, where the draws by repetition count.
+def checkBatchEval(rng, count, depth=5):
+    import AI
+    checked, failed = 0, 0
+    batch = AI.BATCH_EVAL
+    engine = AI.Engine()
+    engine.tt = None
+    try:
+        for i in range(count // 10):
+            squares = rng.sample(range(32), 2 * rng.randrange(1, 5))  # as many Kings on each side
+            black = sum(1 << s for s in squares[::2])
+            white = sum(1 << s for s in squares[1::2])
+            pos = Position(black, white, black | white)
+            for color in 'bw':
+                scores = []
+                for AI.BATCH_EVAL in (False, True):
+                    engine.reset()
+                    scores.append(engine.scoreMoves(pos, color, depth))
+                checked += 1
+                if scores[0] != scores[1]:
+                    failed += 1
+                    if failed <= 5:
+                        print('batch scores', scores[1], 'expected', scores[0], color, 'in\n%r' % pos)
+    finally:
+        AI.BATCH_EVAL = batch
+    print('batch eval    %8d searches %s' % (checked, 'ok' if not failed else '%d FAILED' % failed))
+    return failed
+
+
+# timed searches: the deadline stops the search in the middle of its moves, the position
+# of the caller stays as it was and the move of callMinimax is a whole legal path
+# (capture positions, where a timeout hurts the most)
+def checkTimedSearch(rng, count, time_ms=5):
+    import contextlib
+    import AI
+    from bitboard import toBoard
+    checked, failed = 0, 0
+    while checked < count // 20:
+        pos = randomPosition(rng)
+        moves = getAllMoves(pos, 'b')
+        if not moves or not moves[0] >> 10:
+            continue
+        checked += 1
+        before = pos.copy()
+        AI.Engine().search(pos, 'b', 30, time_ms=time_ms)
+        board = toBoard(pos)
+        with contextlib.redirect_stdout(None):
+            path = AI.callMinimax(board, 'b', 30, time_ms=time_ms)
+        if pos != before or not AI.canMove(board, path, 'b'):
+            failed += 1
+            if failed <= 5:
+                print('timed search changed the position or played', path, 'in\n%r' % before)
+    print('timed search  %8d searches %s' % (checked, 'ok' if not failed else '%d FAILED' % failed))
+    return failed
+
+
+def validate(count=2000, seed=1):
+    rng = random.Random(seed)
+    return (checkValidateMove(rng, count) + checkPackedMoves(rng, count) + checkTablebase(rng, count) +
+            checkBatchEval(rng, count) + checkTimedSearch(rng, count))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '--validate' in args:
+        seed = int(args[args.index('--seed') + 1]) if '--seed' in args else 1
+        args = [arg for arg in args if arg not in ('--validate', '--seed', str(seed))]
+        sys.exit(1 if validate(int(args[0]) if args else 2000, seed) else 0)
+    args = [arg for arg in args if arg != '--update']
+    sys.exit(1 if main(int(args[0]) if args else None, '--update' in sys.argv) else 0)
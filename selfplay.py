@@ -0,0 +1,139 @@
+# Self-play tournament between two engine configurations, to check that a change to the
+# engine does not make it weaker. Games start from initBoard() and from random openings,
+# each opening is played twice with the colors swapped, and run in parallel on a pool.
+#
+#   python selfplay.py [--a config] [--b config] [--games n] [--plies p] [--seed s] [--workers w]
+#
+# A config is a comma separated list of key=value: depth (search depth), time (ms per move,
+# iterative deepening), pvs (0/1), tt (table MB), mcts (0/1: the Monte Carlo engine of
+# mcts.py, with iters playouts or time ms per move), e.g. --a depth=8 --b depth=8,pvs=1 or
+# --a time=500 --b mcts=1,time=500 to compare the engines at the same CPU time per move.
+# With fixed depths or iterations the games only depend on the seed: same seed, same games.
+
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import AI
+import mcts
+from bitboard import op, fromBoard, makeMove, gameOver, getAllMoves, GameHistory
+from transposition import TranspositionTable
+
+DEFAULT_CONFIG = {'depth': 6, 'time': None, 'pvs': 0, 'tt': 16, 'mcts': 0, 'iters': None}
+MAX_PLIES = 200  # longer games are draws, on top of the draw rules of GameHistory
+
+
+def parseConfig(text):
+    config = dict(DEFAULT_CONFIG)
+    for item in filter(None, text.split(',')):
+        key, value = item.split('=')
+        if key not in config:
+            raise ValueError('unknown engine setting: ' + key)
+        config[key] = int(value)
+    return config
+
+
+# the position after plies random moves from initBoard(), the same for the same seed
+def randomOpening(plies, seed):
+    rng = random.Random(seed)
+    while True:
+        pos, color = fromBoard(AI.initBoard(), 'b'), 'b'
+        for ply in range(plies):
+            moves = getAllMoves(pos, color)
+            if not moves:
+                break
+            makeMove(pos, rng.choice(moves))
+            color = op(color)
+        if getAllMoves(pos, color):
+            return pos, color
+
+
+# play one game, engines[color] moves for color; return (winner or None, plies, think
+# time and moves of each color)
+def playGame(engines, pos, color, seed):
+    random.seed(seed)  # the book picks among equal moves at random
+    searchers = {c: mcts.MCTS(seed) if config['mcts'] else
+                 AI.Engine(TranspositionTable(config['tt']), pvs=bool(config['pvs']))
+                 for c, config in engines.items()}
+    think = {'b': 0.0, 'w': 0.0}
+    moves = {'b': 0, 'w': 0}
+    winner = None
+    history = GameHistory(pos)
+    for ply in range(MAX_PLIES):
+        config = engines[color]
+        start = time.perf_counter()
+        # the searchers get a copy: the game goes on from pos, whatever a search left in it
+        if config['mcts']:
+            path = searchers[color].search(pos.copy(), color, config['iters'], config['time'])
+        else:
+            path = searchers[color].search(pos.copy(), color, config['depth'], config['time'], history=history)
+        think[color] += time.perf_counter() - start
+        moves[color] += 1
+        if not path:  # no move left, color loses
+            winner = op(color)
+            break
+        makeMove(pos, path)
+        if gameOver(pos) is not None:
+            winner = color
+            break
+        history.push(pos)
+        if history.draw():
+            break
+        color = op(color)
+    return winner, ply + 1, think, moves
+
+
+# one game of the tournament: opening number i//2, A plays 'b' on even i and 'w' on odd i
+def runGame(args):
+    i, a, b, plies, seed = args
+    pos, color = randomOpening(plies if i >= 2 else 0, seed * 1000003 + i // 2)
+    colorA = 'b' if i % 2 == 0 else 'w'
+    engines = {colorA: a, op(colorA): b}
+    winner, length, think, moves = playGame(engines, pos, color, seed * 1000003 + i)
+    score = 0.5 if winner is None else 1.0 if winner == colorA else 0.0
+    return score, length, think[colorA], moves[colorA], think[op(colorA)], moves[op(colorA)]
+
+
+# Elo difference of a score rate (0 < score < 1)
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1) + 0.0  # no -0
+
+
+def main(a, b, games=40, plies=6, seed=1, workers=None):
+    workers = workers or os.cpu_count() or 1
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(runGame, [(i, a, b, plies, seed) for i in range(games)]))
+    elapsed = time.time() - start
+
+    scores = [result[0] for result in results]
+    n = len(scores)
+    wins, draws = scores.count(1.0), scores.count(0.5)
+    mean = sum(scores) / n
+    sd = math.sqrt(sum((s - mean) ** 2 for s in scores) / (n - 1)) if n > 1 else 0.0
+    margin = 1.96 * sd / math.sqrt(n)  # 95 % confidence interval
+    thinkA, movesA = sum(r[2] for r in results), sum(r[3] for r in results)
+    thinkB, movesB = sum(r[4] for r in results), sum(r[5] for r in results)
+
+    print('A %s\nB %s' % (a, b))
+    print('%d games in %.1f s, %.2f games/s, %.1f plies per game'
+          % (n, elapsed, n / elapsed, sum(r[1] for r in results) / n))
+    print('A: +%d =%d -%d, score %.3f +- %.3f, elo %+.0f [%+.0f, %+.0f]'
+          % (wins, draws, n - wins - draws, mean, margin, elo(mean), elo(mean - margin), elo(mean + margin)))
+    print('think time per move: A %.1f ms, B %.1f ms'
+          % (1000 * thinkA / max(movesA, 1), 1000 * thinkB / max(movesB, 1)))
+    return mean, margin
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    def option(name, default):
+        return args[args.index(name) + 1] if name in args else default
+
+    main(parseConfig(option('--a', '')), parseConfig(option('--b', '')),
+         int(option('--games', 40)), int(option('--plies', 6)), int(option('--seed', 1)),
+         int(option('--workers', 0)) or None)
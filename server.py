@@ -0,0 +1,158 @@
+# Engine service: one process serves the AI moves of many boards over a local socket.
+# The searches run on the worker pool of AI.py, at most --concurrent at a time.
+#
+#   python server.py [--port 7777 | --unix path] [--workers n] [--concurrent n] [--timeout s]
+#
+# One request per line, one reply per line:
+#
+#   <board> <side> <time ms> [depth]   board: 32 characters, square 0 to 31 (see bitboard.py),
+#                                      '.' empty, 'b' 'B' 'w' 'W' pieces; side: b or w
+#   -> MOVE <y,x> <y,x> ... <depth> <score> <nodes>
+#   -> NONE                            the side has no move, it lost
+#   -> ERROR <reason>
+#
+# e.g. "bbbbbbbbbbbb........wwwwwwwwwwww b 1000" -> "MOVE 2,1 3,0 10 -2 41370"
+
+import asyncio
+import os
+import socket
+import sys
+import AI
+from bitboard import Position, moveToPath, unpackMove
+
+DEFAULT_PORT = 7777
+DEFAULT_DEPTH = AI.MAX_PLY
+MAX_TIME_MS = 60000
+TIMEOUT_GRACE = 2.0  # seconds on top of the time budget before a search is given up
+
+
+# (black, white, kings) of a 32 character board, ValueError if it is not one
+def parseBoard(text):
+    if len(text) != 32 or set(text) - set('.bBwW'):
+        raise ValueError('bad board')
+    black, white, kings = 0, 0, 0
+    for s, c in enumerate(text):
+        if c in 'bB':
+            black |= 1 << s
+        elif c in 'wW':
+            white |= 1 << s
+        if c in 'BW':
+            kings |= 1 << s
+    return black, white, kings
+
+
+def formatBoard(pos):
+    board = []
+    for s in range(32):
+        if pos.black >> s & 1:
+            c = 'b'
+        elif pos.white >> s & 1:
+            c = 'w'
+        else:
+            c = '.'
+        board.append(c.upper() if pos.kings >> s & 1 else c)
+    return ''.join(board)
+
+
+class EngineServer:
+    def __init__(self, workers=None, concurrent=None, timeout=None):
+        workers = workers or os.cpu_count() or 1
+        AI.startPool(workers)
+        self.limit = asyncio.Semaphore(concurrent or workers)
+        self.timeout = timeout  # at most this many seconds per search, None: time budget + grace
+        self.requests = 0
+
+    async def search(self, line):
+        fields = line.split()
+        if len(fields) not in (3, 4) or fields[1] not in ('b', 'w'):
+            return 'ERROR bad request'
+        try:
+            black, white, kings = parseBoard(fields[0])
+            time_ms = min(int(fields[2]), MAX_TIME_MS)
+            depth = min(int(fields[3]), AI.MAX_PLY) if len(fields) == 4 else DEFAULT_DEPTH
+        except ValueError as e:
+            return 'ERROR ' + str(e)
+        if time_ms <= 0 or depth <= 0:
+            return 'ERROR bad time or depth'
+        color = fields[1]
+        if self.timeout:  # the search stops on its own before the timeout, grace included
+            time_ms = min(time_ms, int(1000 * max(self.timeout - TIMEOUT_GRACE, self.timeout / 2)))
+        timeout = self.timeout or time_ms / 1000.0 + TIMEOUT_GRACE
+
+        # a worker cannot be stopped: on a timeout the job goes on, and keeps its place
+        # under the limit until it is really over
+        loop = asyncio.get_running_loop()
+        await self.limit.acquire()
+        future = loop.run_in_executor(AI.POOL, AI.searchPosition, black, white, kings, color, depth, time_ms)
+        future.add_done_callback(lambda future: self.limit.release())
+        try:
+            move, depth, score, nodes = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return 'ERROR timeout'
+        self.requests += 1
+        if move is None:
+            return 'NONE'
+        path = unpackMove(Position(black, white, kings), move)
+        squares = ' '.join('%d,%d' % square for square in moveToPath(path))
+        return 'MOVE %s %d %d %d' % (squares, depth, score or 0, nodes)  # no score for a book move
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('ascii', 'replace').strip()
+                if not line:
+                    continue
+                # each request of the connection is answered in order
+                writer.write((await self.search(line) + '\n').encode('ascii'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(port=DEFAULT_PORT, unix=None, workers=None, concurrent=None, timeout=None):
+    service = EngineServer(workers, concurrent, timeout)
+    if unix is not None:
+        server = await asyncio.start_unix_server(service.handle, path=unix)
+    else:
+        server = await asyncio.start_server(service.handle, '127.0.0.1', port)
+    print('serving on', unix or '127.0.0.1:%d' % port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        AI.stopPool()
+
+
+# client side: ask the service for the move of color (list of (y, x), [] if none)
+def ask(pos, color, time_ms, depth=None, port=DEFAULT_PORT, unix=None):
+    if unix is not None:
+        sock = socket.socket(socket.AF_UNIX)
+        sock.connect(unix)
+    else:
+        sock = socket.create_connection(('127.0.0.1', port))
+    with sock, sock.makefile('rw') as f:
+        f.write('%s %s %d%s\n' % (formatBoard(pos), color, time_ms, '' if depth is None else ' %d' % depth))
+        f.flush()
+        reply = f.readline().split()
+    if not reply or reply[0] == 'ERROR':
+        raise RuntimeError(' '.join(reply[1:]) or 'no reply')
+    if reply[0] == 'NONE':
+        return []
+    return [tuple(int(v) for v in square.split(',')) for square in reply[1:-3]]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        return args[args.index(name) + 1] if name in args else default
+
+    timeout = option('--timeout')
+    asyncio.run(serve(int(option('--port', DEFAULT_PORT)), option('--unix'),
+                      int(option('--workers', 0)) or None, int(option('--concurrent', 0)) or None,
+                      float(timeout) if timeout else None))
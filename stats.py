@@ -0,0 +1,58 @@
+# Statistics of one search (AI.Engine.search), to profile the engine in real games:
+# callMinimax(..., stats=True) returns them with the move and
+# callMinimax(..., stats_file=path) appends them to the file as one JSON line.
+
+import json
+
+
+class SearchStats:
+    def __init__(self, color):
+        self.color = color
+        self.source = 'search'  # where the move comes from: 'search', 'book' or 'tablebase'
+        self.move = []  # chosen path, as (y, x) squares
+        self.score = None  # score of the last completed iteration, for color
+        self.depth = 0  # last completed depth
+        self.time = 0.0  # seconds
+        self.nodes = 0
+        self.leaves = 0  # positions scored by the evaluation
+        self.cutoffs = 0  # beta cutoffs
+        self.firstCutoffs = 0  # beta cutoffs on the first move tried
+        self.depthNodes = []  # nodes of each completed iteration, from depth 1 (or the fixed depth)
+        self.depthTimes = []  # seconds of each completed iteration
+        self.ttProbes = 0
+        self.ttHits = 0
+
+    # effective branching factor: growth of the nodes from one iteration to the next, or
+    # the depth-th root of the nodes of a single search
+    def branching(self):
+        counts = [n for n in self.depthNodes if n]
+        if len(counts) >= 2:
+            return counts[-1] / counts[-2]
+        if self.nodes and self.depth:
+            return self.nodes ** (1.0 / self.depth)
+        return 0.0
+
+    def firstCutoffRate(self):
+        return self.firstCutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+    def toDict(self):
+        return {'color': self.color, 'source': self.source, 'move': [list(square) for square in self.move],
+                'score': self.score, 'depth': self.depth, 'time': round(self.time, 6),
+                'nodes': self.nodes, 'leaves': self.leaves,
+                'nps': round(self.nodes / self.time) if self.time else 0,
+                'cutoffs': self.cutoffs, 'firstCutoffs': self.firstCutoffs,
+                'firstCutoffRate': round(self.firstCutoffRate(), 4),
+                'depthNodes': self.depthNodes, 'depthTimes': [round(t, 6) for t in self.depthTimes],
+                'branching': round(self.branching(), 3),
+                'ttProbes': self.ttProbes, 'ttHits': self.ttHits, 'ttHitRate': round(self.ttHitRate(), 4)}
+
+    # append the stats to an open file as one JSON line
+    def write(self, f):
+        f.write(json.dumps(self.toDict()) + '\n')
+        f.flush()
+
+    def __repr__(self):
+        return 'SearchStats(%s)' % json.dumps(self.toDict())
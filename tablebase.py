@@ -0,0 +1,271 @@
+# Endgame tablebase: retrograde analysis of every position with few pieces left,
+# written to a compact binary file that the search probes through mmap.
+#
+#   python tablebase.py [max_pieces] [file]
+#
+# A value is from the point of view of the side to move: 0 is a draw, d > 0 a win in
+# d plies and d < 0 a loss in -d - 1 plies (-1: no move left).
+#
+# File: header (magic, version, number of slices), one directory entry per material
+# (black men, black kings, white men, white kings) with its size and offset, then per
+# slice the int16 values of 'b' to move followed by those of 'w' to move.
+
+import mmap
+import struct
+import sys
+import time
+from array import array
+from math import comb
+from bitboard import (FULL, KING_DIRS, Position, op, makeMove, unmakeMove, getAllMoves, getJumpers,
+                      upLeft, upRight, downLeft, downRight)
+
+MAGIC = b'BMTB'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+ENTRY = struct.Struct('<4BIQ')
+VALUE = struct.Struct('<h')
+
+DEFAULT_PIECES = 4
+DEFAULT_FILE = 'endgame.tb'
+
+C = [[comb(n, k) for k in range(13)] for n in range(33)]
+
+# men never stand on their own king row: 'b' men on squares 0-27, 'w' men on 4-31
+MEN_SQUARES = 28
+
+
+# rank of a set of squares among all the sets of the same size (colex order)
+def rank(bb):
+    r, k = 0, 1
+    while bb:
+        b = bb & -bb
+        bb ^= b
+        r += C[b.bit_length() - 1][k]
+        k += 1
+    return r
+
+
+def unrank(r, k):
+    bb = 0
+    s = 31
+    while k:
+        while C[s][k] > r:
+            s -= 1
+        r -= C[s][k]
+        bb |= 1 << s
+        k -= 1
+        s -= 1
+    return bb
+
+
+def sliceSize(sig):
+    bm, bk, wm, wk = sig
+    return C[MEN_SQUARES][bm] * C[MEN_SQUARES][wm] * C[32][bk] * C[32][wk]
+
+
+def material(pos):
+    return pos.blackMen, pos.blackKings, pos.whiteMen, pos.whiteKings
+
+
+def index(pos, sig):
+    bm, bk, wm, wk = sig
+    kings = pos.kings
+    i = rank(pos.black & ~kings)
+    i = i * C[MEN_SQUARES][wm] + rank((pos.white & ~kings) >> 4)
+    i = i * C[32][bk] + rank(pos.black & kings)
+    return i * C[32][wk] + rank(pos.white & kings)
+
+
+# the position of an index, None if two pieces share a square
+def position(i, sig):
+    bm, bk, wm, wk = sig
+    i, r = divmod(i, C[32][wk])
+    whiteKings = unrank(r, wk)
+    i, r = divmod(i, C[32][bk])
+    blackKings = unrank(r, bk)
+    i, r = divmod(i, C[MEN_SQUARES][wm])
+    whiteMen = unrank(r, wm) << 4
+    blackMen = unrank(i, bm)
+    black, white = blackMen | blackKings, whiteMen | whiteKings
+    if black & white or blackMen & blackKings or whiteMen & whiteKings:
+        return None
+    return Position(black, white, blackKings | whiteKings)
+
+
+# all the materials with 1 to maxPieces pieces per side, in the order they can be solved:
+# captures lower the number of pieces, promotions the number of men
+def materials(maxPieces):
+    sigs = []
+    for total in range(2, maxPieces + 1):
+        for nb in range(1, total):
+            nw = total - nb
+            for bm in range(nb + 1):
+                for wm in range(nw + 1):
+                    sigs.append((bm, nb - bm, wm, nw - wm))
+    sigs.sort(key=lambda sig: (sum(sig), sig[0] + sig[2]))
+    return sigs
+
+
+# value of a solved position, for the side to move
+def lookup(tables, pos, color):
+    if pos.black == 0:
+        return -1 if color == 'b' else 1
+    if pos.white == 0:
+        return -1 if color == 'w' else 1
+    sig = material(pos)
+    return tables[sig][color][index(pos, sig)]
+
+
+def solveSlice(sig, tables):
+    size = sliceSize(sig)
+    values = {'b': array('h', bytes(2 * size)), 'w': array('h', bytes(2 * size))}
+    solved = {'b': bytearray(size), 'w': bytearray(size)}
+    remaining = {'b': bytearray(size), 'w': bytearray(size)}  # unsolved moves inside the slice
+    outWin = {'b': array('h', bytes(2 * size)), 'w': array('h', bytes(2 * size))}  # longest win of the opponent out of it
+    buckets = {}  # plies -> [(color, index, value)]
+
+    def push(d, color, i, value):
+        buckets.setdefault(d, []).append((color, i, value))
+
+    # first pass: the moves leaving the slice (captures, promotions) are already solved
+    for i in range(size):
+        pos = position(i, sig)
+        if pos is None:
+            continue
+        for color in ['b', 'w']:
+            moves = getAllMoves(pos, color)
+            if not moves:
+                push(0, color, i, -1)
+                continue
+            inside, win, loss, draw = 0, 0, None, False
+            for move in moves:
+                undo = makeMove(pos, move)
+                if undo[2] == 0 and not undo[4]:
+                    inside += 1
+                else:
+                    v = lookup(tables, pos, op(color))
+                    if v < 0:
+                        loss = -v - 1 if loss is None else min(loss, -v - 1)
+                    elif v > 0:
+                        win = max(win, v)
+                    else:
+                        draw = True
+                unmakeMove(pos, undo)
+            if loss is not None:
+                push(loss + 1, color, i, loss + 1)
+            elif inside == 0 and not draw:
+                push(win + 1, color, i, -(win + 1) - 1)
+            remaining[color][i] = 255 if draw or loss is not None else inside  # 255: can not lose
+            outWin[color][i] = win
+
+    # then go backwards from the solved positions, shortest distance first
+    d = 0
+    while buckets:
+        for color, i, value in buckets.pop(d, []):
+            if solved[color][i]:
+                continue
+            solved[color][i] = 1
+            values[color][i] = value
+            for prev, j in predecessors(position(i, sig), op(color), sig):
+                if solved[prev][j]:
+                    continue
+                if value < 0:  # the mover of prev wins by going here
+                    push(d + 1, prev, j, d + 1)
+                elif remaining[prev][j] != 255:
+                    remaining[prev][j] -= 1
+                    if remaining[prev][j] == 0:  # every move of prev loses
+                        loss = max(d, outWin[prev][j]) + 1
+                        push(loss, prev, j, -loss - 1)
+        d += 1
+    return values
+
+
+# the positions of the slice with color to move that reach pos by a quiet move
+def predecessors(pos, color, sig):
+    if color == 'b':
+        own = pos.black
+        manDirs = (upLeft, upRight)
+    else:
+        own = pos.white
+        manDirs = (downLeft, downRight)
+    empty = ~(pos.black | pos.white) & FULL
+    kings = own & pos.kings
+    result = []
+    while own:
+        b = own & -own
+        own ^= b
+        for back in KING_DIRS if kings & b else manDirs:
+            a = back(b) & empty
+            if not a:
+                continue
+            prev = pos.copy()
+            if color == 'b':
+                prev.black ^= a | b
+            else:
+                prev.white ^= a | b
+            if kings & b:
+                prev.kings ^= a | b
+            if getJumpers(prev, color):  # the quiet move was not allowed
+                continue
+            result.append((color, index(prev, sig)))
+    return result
+
+
+def build(maxPieces=DEFAULT_PIECES, path=DEFAULT_FILE):
+    tables = {}
+    for sig in materials(maxPieces):
+        start = time.time()
+        tables[sig] = solveSlice(sig, tables)
+        print(sig, sliceSize(sig), 'positions', round(time.time() - start, 1), 's')
+
+    sigs = materials(maxPieces)
+    offset = HEADER.size + ENTRY.size * len(sigs)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sigs)))
+        for sig in sigs:
+            size = sliceSize(sig)
+            f.write(ENTRY.pack(*sig, size, offset))
+            offset += 4 * size
+        for sig in sigs:
+            for color in ['b', 'w']:
+                values = tables[sig][color]
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                f.write(values.tobytes())
+
+
+# read-only view of a tablebase file, loaded lazily by the OS through mmap
+class Tablebase:
+    def __init__(self, path=DEFAULT_FILE):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a tablebase file: ' + path)
+        self.slices = {}
+        self.maxPieces = 0
+        for k in range(count):
+            bm, bk, wm, wk, size, offset = ENTRY.unpack_from(self.data, HEADER.size + k * ENTRY.size)
+            self.slices[(bm, bk, wm, wk)] = (size, offset)
+            self.maxPieces = max(self.maxPieces, bm + bk + wm + wk)
+
+    # value of the position for color to move, None if it is not in the tablebase
+    def probe(self, pos, color):
+        sig = material(pos)
+        entry = self.slices.get(sig)
+        if entry is None:
+            return None
+        size, offset = entry
+        i = index(pos, sig)
+        if color == 'w':
+            i += size
+        return VALUE.unpack_from(self.data, offset + 2 * i)[0]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+if __name__ == '__main__':
+    pieces = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PIECES
+    build(pieces, sys.argv[2] if len(sys.argv) > 2 else DEFAULT_FILE)
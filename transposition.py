@@ -0,0 +1,49 @@
+# Fixed-size transposition table for the minimax search, indexed by the Zobrist
+# hash of the position (bitboard.Position.hash).
+#
+# Each bucket has two slots: a depth-preferred one that is only overwritten by a
+# search at least as deep, and an always-replace one that keeps the latest entry.
+# Scores are stored from the point of view of the side to move.
+
+EXACT, LOWER, UPPER = 0, 1, 2  # bound type of the stored score
+
+ENTRY_BYTES = 128  # rough size of one stored entry (tuple, key, move)
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        buckets = 1
+        while (buckets * 2) * 2 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.slots = [None] * (2 * buckets)
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+        self.probes = 0
+        self.hits = 0
+
+    # return the entry (key, depth, score, flag, move) of the position, or None
+    def probe(self, key):
+        self.probes += 1
+        i = (key & self.mask) << 1
+        entry = self.slots[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.slots[i + 1]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        i = (key & self.mask) << 1
+        entry = (key, depth, score, flag, move)
+        old = self.slots[i]
+        if old is None or old[0] == key or depth >= old[1]:
+            self.slots[i] = entry
+        else:
+            self.slots[i + 1] = entry